@@ -1,62 +1,43 @@
 import streamlit as st
 import numpy as np
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
+import os
 import time
-import cv2
-from camera_utils import MotionDetector
-
-class MotorImageryDataset:
-    def __init__(self, dataset='A01T.npz'):
-        if not dataset.endswith('.npz'):
-            dataset += '.npz'
-
-        self.data = np.load(dataset)
-        self.Fs = 250
-        self.raw = self.data['s'].T
-        self.events_type = self.data['etyp'].T
-        self.events_position = self.data['epos'].T
-        self.events_duration = self.data['edur'].T
-        self.artifacts = self.data['artifacts'].T
-
-        self.mi_types = {769: 'left', 770: 'right',
-                        771: 'foot', 772: 'tongue', 783: 'unknown'}
-
-    def get_trials_from_channel(self, channel=7):
-        startrial_code = 768
-        starttrial_events = self.events_type == startrial_code
-        idxs = [i for i, x in enumerate(starttrial_events[0]) if x]
-
-        trials = []
-        classes = []
-
-        for index in idxs:
-            try:
-                type_e = self.events_type[0, index+1]
-                class_e = self.mi_types[type_e]
-                classes.append(class_e)
+import uuid
+from dataset_utils import MotorImageryDataset, dataset_cache
+from metrics import camera_timers, export as export_metrics, serve as serve_metrics
+
+# Only lightweight modules are imported up front. Plotly, OpenCV, SciPy and
+# scikit-learn are imported by the tab that needs them, so a cold start only
+# pays for the tab that is open.
+
+HEATMAP_WIDTH_PX = 800
+METRICS_FILE = os.environ.get('SYNCWAVE_METRICS_FILE')
+METRICS_PORT = os.environ.get('SYNCWAVE_METRICS_PORT')
+# Camera index or video file shared by every session.
+CAMERA_SOURCE = os.environ.get('SYNCWAVE_CAMERA_SOURCE', '0')
+CAMERA_SOURCE = int(CAMERA_SOURCE) if CAMERA_SOURCE.isdigit() else CAMERA_SOURCE
+RECORDINGS_DIR = os.environ.get('SYNCWAVE_RECORDINGS_DIR', 'recordings')
 
-                start = self.events_position[0, index]
-                stop = start + self.events_duration[0, index]
-                trial = self.raw[channel, start:stop]
-                trial = trial.reshape((1, -1))
-                trials.append(trial)
 
-            except:
-                continue
+def read_subject_file(path):
+    with open(path, "rb") as f:
+        return f.read()
 
-        return trials, classes
 
-    def get_trials_from_channels(self, channels=[7, 9, 11]):
-        trials_c = []
-        classes_c = []
-        for c in channels:
-            t, c = self.get_trials_from_channel(channel=c)
-            tt = np.concatenate(t, axis=0)
-            trials_c.append(tt)
-            classes_c.append(c)
+def release_camera():
+    # Ends the live loop: leaves the shared pipeline, finishes any recording
+    # in progress and closes a replay.
+    for key in ('motion_subscription', 'session_recorder', 'session_player'):
+        if st.session_state.get(key) is not None:
+            st.session_state[key].close()
+            st.session_state[key] = None
+    st.session_state.camera_running = False
 
-        return trials_c, classes_c
+
+if METRICS_PORT:
+    serve_metrics(camera_timers, int(METRICS_PORT))
+if METRICS_FILE:
+    export_metrics(camera_timers, METRICS_FILE)
 
 
 st.set_page_config(page_title="BCI", layout="wide", initial_sidebar_state='expanded')
@@ -70,15 +51,35 @@ subject = st.sidebar.selectbox(
     [f"A0{i}T" for i in range(1, 10)]
 )
 
-with open(f"{subject}.npz", "rb") as file:
-    btn = st.sidebar.download_button(
-        label="Download",
-        data=file,
-        file_name=f"{subject}.npz",
-        mime="application/x-npz",
-        type="primary"
-    )
+# The file is only read when the button is clicked, not on every rerun.
+btn = st.sidebar.download_button(
+    label="Download",
+    data=lambda: read_subject_file(f"{subject}.npz"),
+    file_name=f"{subject}.npz",
+    mime="application/x-npz",
+    type="primary",
+    on_click="ignore"
+)
 
+exclude_artifacts = st.sidebar.checkbox(
+    "Exclude artifact trials", value=True,
+    help="Leave out trials marked by the expert scoring or rejected during recording"
+)
+remove_eog = st.sidebar.checkbox(
+    "Remove eye artifacts (EOG regression)", value=False,
+    help="Subtract the part of each EEG channel explained by the three EOG channels"
+)
+
+with st.sidebar.expander("Dataset cache"):
+    cache_stats = dataset_cache.stats()
+    st.caption(
+        f"Hits: {cache_stats['hits']} | Misses: {cache_stats['misses']} | "
+        f"Evictions: {cache_stats['evictions']}"
+    )
+    st.caption(
+        f"Memory: {cache_stats['bytes'] / 2**20:.0f} / {cache_stats['max_bytes'] / 2**20:.0f} MB "
+        f"({cache_stats['subjects']} subjects)"
+    )
 
 st.sidebar.divider()
 st.sidebar.page_link(page="https://github.com/rounakdey2003/SyncWave", label=":blue-background[:blue[Github]]",
@@ -95,310 +96,539 @@ with st.container(border=True):
     """)
 
 
-dataset = MotorImageryDataset(subject)
-trials, classes = dataset.get_trials_from_channels([7, 9, 11])
-
-tab1, tab2, tab3 = st.tabs(["Brain Activity Map", "Brain Signals Explorer", "Movement Detection"])
-
-with tab1:
-    with st.container(border=True):
-        st.markdown("""
-        ### Brain Activity
-        - :red[**Red colors**]: Brain is very active
-        - :blue[**Blue colors**]: Brain is resting
-
-        - **Brain Part**:
-            - **C3**: Left side of the brain (helps control right side of body)
-            - **Cz**: Middle of the brain (helps with foot and tongue movements)
-            - **C4**: Right side of the brain (helps control left side of body)
-        """)
-    with st.container(border=True):
-        fig = make_subplots(rows=3, cols=1, 
-                            subplot_titles=('Left Brain (C3)', 'Middle Brain (Cz)', 'Right Brain (C4)'),
-                            vertical_spacing=0.15)
-
-        for i, (trial, title) in enumerate(zip(trials, ['C3', 'Cz', 'C4'])):
-            fig.add_trace(
-                go.Heatmap(
-                    z=trial,
-                    showscale=(i == 0),
-                    colorscale='RdBu',
-                    name=title
-                ),
-                row=i+1, col=1
+# With on_change="rerun" only the open tab reports .open, and the other
+# tabs' bodies are skipped entirely.
+tab1, tab2, tab3, tab4 = st.tabs(["Brain Activity Map", "Brain Signals Explorer", "Movement Detection",
+                                  "Motor Imagery Decoding"], key="view", on_change="rerun")
+
+if st.session_state.get('camera_running') and not tab3.open:
+    # Leaving the Movement Detection tab releases the camera.
+    release_camera()
+
+if tab1.open:
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    from heatmap_utils import get_heatmap_pyramid
+    from time_frequency import get_erd
+
+    dataset = MotorImageryDataset(subject)
+    trials, classes = dataset.get_trials_from_channels([7, 9, 11], clean=exclude_artifacts, eog=remove_eog)
+
+    with tab1:
+        with st.container(border=True):
+            st.markdown("""
+            ### Brain Activity
+            - :red[**Red colors**]: Brain is very active
+            - :blue[**Blue colors**]: Brain is resting
+
+            - **Brain Part**:
+                - **C3**: Left side of the brain (helps control right side of body)
+                - **Cz**: Middle of the brain (helps with foot and tongue movements)
+                - **C4**: Right side of the brain (helps control left side of body)
+            """)
+        with st.container(border=True):
+            n_trials, n_samples = trials[0].shape
+            zoom_col1, zoom_col2 = st.columns(2)
+            with zoom_col1:
+                time_window = st.slider(
+                    "Time window (s)", 0.0, n_samples / dataset.Fs,
+                    (0.0, n_samples / dataset.Fs), step=0.1, key="heatmap_time_window"
+                )
+            with zoom_col2:
+                trial_window = st.slider(
+                    "Trials", 1, n_trials, (1, n_trials), key="heatmap_trial_window"
+                )
+
+            fig = make_subplots(rows=3, cols=1, 
+                                subplot_titles=('Left Brain (C3)', 'Middle Brain (Cz)', 'Right Brain (C4)'),
+                                vertical_spacing=0.15)
+
+            x_range = (int(time_window[0] * dataset.Fs), int(time_window[1] * dataset.Fs) + 1)
+            y_range = (trial_window[0] - 1, trial_window[1])
+            for i, (channel, title) in enumerate(zip([7, 9, 11], ['C3', 'Cz', 'C4'])):
+                pyramid = get_heatmap_pyramid(dataset, channel, clean=exclude_artifacts, eog=remove_eog)
+                z, x, y = pyramid.get(HEATMAP_WIDTH_PX, x_range=x_range, y_range=y_range)
+                fig.add_trace(
+                    go.Heatmap(
+                        z=z,
+                        x=x / dataset.Fs,
+                        y=y + 1,
+                        showscale=(i == 0),
+                        colorscale='RdBu',
+                        name=title
+                    ),
+                    row=i+1, col=1
+                )
+
+            fig.update_layout(
+                height=900,
+                width=HEATMAP_WIDTH_PX,
+                title_text=f"Activity Monitor",
+                showlegend=False,
+                font=dict(size=14)
             )
 
-        fig.update_layout(
-            height=900,
-            width=800,
-            title_text=f"Activity Monitor",
-            showlegend=False,
-            font=dict(size=14)
-        )
-
-        st.plotly_chart(fig, use_container_width=True, key="brain_activity_map")
-
-with tab2:
-    with st.container(border=True):
-        st.markdown("""
-        ### Brain Signals
-        - Each bump in the line means brain sending a tiny electrical signal
-        - When the line goes up and down a lot, means brain is very active
-        - When the line is flatter, means brain is more relaxed
-        """)
-    with st.container(border=True):
-        selected_channel = st.selectbox(
-            "Choose brain part",
-            ["Left Brain (C3)", "Middle Brain (Cz)", "Right Brain (C4)"]
-        )
+            st.plotly_chart(fig, use_container_width=True, key="brain_activity_map")
+
+        with st.container(border=True):
+            st.markdown("""
+            ### Event-Related Desynchronization
+            - Power change relative to the 0.5-1.5 s rest period, averaged over all trials of a movement
+            - :blue[**Blue**]: power drops while imagining the movement (ERD)
+            - :red[**Red**]: power rises (ERS)
+            """)
+            erd_col1, erd_col2 = st.columns(2)
+            with erd_col1:
+                tf_method = st.radio("Method", ["stft", "morlet"], horizontal=True,
+                                     format_func=lambda m: {'stft': "Short-time FFT", 'morlet': "Morlet wavelets"}[m])
+            erd = get_erd(dataset, channels=(7, 9, 11), method=tf_method,
+                          clean=exclude_artifacts, eog=remove_eog)
+            with erd_col2:
+                erd_class = st.selectbox(
+                    "Movement", range(len(erd['classes'])),
+                    format_func=lambda k: f"{dataset.mi_types[int(erd['classes'][k])]} ({erd['counts'][k]} trials)"
+                )
+
+            fig_erd = make_subplots(rows=1, cols=3, shared_yaxes=True,
+                                    subplot_titles=('Left Brain (C3)', 'Middle Brain (Cz)', 'Right Brain (C4)'))
+            for i in range(3):
+                fig_erd.add_trace(
+                    go.Heatmap(
+                        z=erd['erd'][erd_class, i],
+                        x=erd['times'],
+                        y=erd['freqs'],
+                        zmid=0,
+                        zmin=-100,
+                        zmax=100,
+                        colorscale='RdBu_r',
+                        colorbar=dict(title="%"),
+                        showscale=(i == 0)
+                    ),
+                    row=1, col=i+1
+                )
+                fig_erd.add_vline(x=2.0, line_dash='dot', line_color='black', row=1, col=i+1)
+            fig_erd.update_xaxes(title_text="Time (s)")
+            fig_erd.update_yaxes(title_text="Frequency (Hz)", row=1, col=1)
+            fig_erd.update_layout(height=400, title_text="ERD/ERS (cue at 2 s)")
+
+            st.plotly_chart(fig_erd, use_container_width=True, key="erd_map")
+
+if tab2.open:
+    import plotly.graph_objects as go
+    from features import BANDS, FeatureStore, class_means
+
+    dataset = MotorImageryDataset(subject)
+    trials, classes = dataset.get_trials_from_channels([7, 9, 11], clean=exclude_artifacts, eog=remove_eog)
+    feature_store = FeatureStore()
+
+    with tab2:
+        with st.container(border=True):
+            st.markdown("""
+            ### Brain Signals
+            - Each bump in the line means brain sending a tiny electrical signal
+            - When the line goes up and down a lot, means brain is very active
+            - When the line is flatter, means brain is more relaxed
+            """)
+        with st.container(border=True):
+            selected_channel = st.selectbox(
+                "Choose brain part",
+                ["Left Brain (C3)", "Middle Brain (Cz)", "Right Brain (C4)"]
+            )
         
-        channel_idx = {'Left Brain (C3)': 0, 'Middle Brain (Cz)': 1, 'Right Brain (C4)': 2}
+            channel_idx = {'Left Brain (C3)': 0, 'Middle Brain (Cz)': 1, 'Right Brain (C4)': 2}
         
 
-        fig2 = go.Figure()
-        fig2.add_trace(go.Scatter(
-            y=trials[channel_idx[selected_channel]][0],
-            mode='lines',
-            name='Brain Signal',
-            line=dict(color='#2E86C1', width=2)
-        ))
+            fig2 = go.Figure()
+            fig2.add_trace(go.Scatter(
+                y=trials[channel_idx[selected_channel]][0],
+                mode='lines',
+                name='Brain Signal',
+                line=dict(color='#2E86C1', width=2)
+            ))
         
-        fig2.update_layout(
-            title=f"Brain Waves from {selected_channel}",
-            yaxis_title="Signal Strength",
-            xaxis_title="Time",
-            showlegend=False,
-            height=400
-        )
+            fig2.update_layout(
+                title=f"Brain Waves from {selected_channel}",
+                yaxis_title="Signal Strength",
+                xaxis_title="Time",
+                showlegend=False,
+                height=400
+            )
         
-        st.plotly_chart(fig2, use_container_width=True, key="brain_signal_plot")
+            st.plotly_chart(fig2, use_container_width=True, key="brain_signal_plot")
+
+        with st.container(border=True):
+            st.markdown("### Band Power by Movement")
+            band_features = feature_store.get(subject, clean=exclude_artifacts, eog=remove_eog)
+            band_means = class_means(band_features)
+            eeg_channel = [7, 9, 11][channel_idx[selected_channel]]
+
+            fig_bands = go.Figure()
+            for b, band in enumerate(band_features['bands']):
+                low, high = BANDS[str(band)]
+                fig_bands.add_trace(go.Bar(
+                    x=list(band_means),
+                    y=[p[eeg_channel, b] for p in band_means.values()],
+                    name=f"{band} ({low}-{high} Hz)"
+                ))
+
+            fig_bands.update_layout(
+                title=f"Average band power at {selected_channel}",
+                yaxis_title="Power",
+                barmode='group',
+                height=350
+            )
+
+            st.plotly_chart(fig_bands, use_container_width=True, key="band_power_plot")
         
-with tab3:
-    with st.container(border=True):
-        st.markdown("""
-        ### Camera-Based Movement Detection
-        This feature uses your webcam to detect body movements and shows which parts of your brain would be active during these movements.
+if tab3.open:
+    import cv2
+    import motion_service
+    from camera_utils import SignalStreamer
+    from figures import REGIONS, LiveFigures, brain_region_figure
+    from motion_engines import ENGINES
+    from pacing import FramePacer
+    from session_recorder import SessionPlayer, SessionRecorder, list_sessions
+
+    with tab3:
+        with st.container(border=True):
+            st.markdown("""
+            ### Camera-Based Movement Detection
+            This feature uses your webcam to detect body movements and shows which parts of your brain would be active during these movements.
         
-        - **Left Hand Movement**: Activates the right side of your brain (C4)
-        - **Right Hand Movement**: Activates the left side of your brain (C3)
-        - **Head Movement**: Activates the middle of your brain (Cz)
-        """)
+            - **Left Hand Movement**: Activates the right side of your brain (C4)
+            - **Right Hand Movement**: Activates the left side of your brain (C3)
+            - **Head Movement**: Activates the middle of your brain (Cz)
+            """)
     
 
 
-        example_fig = go.Figure()
-        
-        for i, region in enumerate(['C3', 'Cz', 'C4']):
-            is_active = i % 2 == 0
-            color = 'rgba(255, 0, 0, 0.7)' if is_active else 'rgba(0, 0, 255, 0.7)'
-            example_fig.add_trace(go.Scatter(
-                x=[i-0.4, i+0.4, i+0.4, i-0.4, i-0.4],
-                y=[-0.4, -0.4, 0.4, 0.4, -0.4],
-                fill="toself",
-                fillcolor=color,
-                line=dict(color='black'),
-                mode='lines',
-                name=region,
-                text=f"{region}: {'Active' if is_active else 'Resting'}",
-                hoverinfo='text'
-            ))
-            
-            example_fig.add_annotation(
-                x=i, y=0,
-                text=region,
-                showarrow=False,
-                font=dict(color='white', size=14)
+            example_fig = brain_region_figure(
+                {region: {'active': i % 2 == 0} for i, region in enumerate(REGIONS)},
+                title="Example: Brain Activity Based on Movement",
+                margin=None
             )
         
-        example_fig.update_layout(
-            title="Example: Brain Activity Based on Movement",
-            xaxis=dict(showticklabels=False, range=[-1, 3]),
-            yaxis=dict(showticklabels=False, range=[-1, 1]),
-            showlegend=False,
-            height=300
-        )
-        
-        st.plotly_chart(example_fig, use_container_width=True, key="example_brain_activity")
+            st.plotly_chart(example_fig, use_container_width=True, key="example_brain_activity")
 
-    if 'camera_running' not in st.session_state:
-        st.session_state.camera_running = False
-        st.session_state.motion_detector = None
+        if 'camera_running' not in st.session_state:
+            st.session_state.camera_running = False
+            st.session_state.motion_subscription = None
+            st.session_state.session_recorder = None
+            st.session_state.session_player = None
+        if 'camera_timer' not in st.session_state:
+            # Each session times its own loop; the metrics export labels it
+            # with this id.
+            st.session_state.camera_timer = camera_timers.get(uuid.uuid4().hex[:8])
+        camera_timer = st.session_state.camera_timer
     
-    col1, col2 = st.columns(2)
-    with col1:
-        if not st.session_state.camera_running:
-            if st.button("Start Camera", type="primary"):
-                try:
-                    st.session_state.motion_detector = MotionDetector()
-                    if st.session_state.motion_detector.start_camera():
+        with st.expander("Detection settings"):
+            processing_scale = st.select_slider(
+                "Processing resolution", options=[0.25, 0.5, 0.75, 1.0], value=0.5,
+                format_func=lambda x: f"{int(x * 100)}%",
+                disabled=st.session_state.camera_running
+            )
+            roi_only = st.checkbox(
+                "Only process body regions", value=True,
+                disabled=st.session_state.camera_running
+            )
+            motion_engine = st.selectbox(
+                "Background model", list(ENGINES),
+                format_func=lambda name: ENGINES[name].label,
+                disabled=st.session_state.camera_running
+            )
+            target_fps = st.select_slider(
+                "Target frame rate", options=[5, 10, 15, 30], value=10,
+                format_func=lambda x: f"{x} FPS",
+                help="Drops to 2 FPS after 5 s without motion and sheds work on alternate frames when over budget",
+                disabled=st.session_state.camera_running
+            )
+            chart_rate = st.select_slider(
+                "Chart refresh rate", options=[1, 2, 5, 10, 15], value=5,
+                format_func=lambda x: f"{x} per second",
+                disabled=st.session_state.camera_running
+            )
+            record_session = st.checkbox(
+                "Record session", value=False,
+                help=f"Save the video, region activity and signals under {RECORDINGS_DIR}/",
+                disabled=st.session_state.camera_running
+            )
+            show_diagnostics = st.checkbox("Show loop diagnostics", value=False)
+
+        recordings = list_sessions(RECORDINGS_DIR)
+        if recordings:
+            with st.expander("Replay a recording"):
+                replay_name = st.selectbox("Recording", recordings, disabled=st.session_state.camera_running)
+                replay_speed = st.select_slider(
+                    "Replay speed", options=[0.5, 1.0, 2.0, 4.0], value=1.0,
+                    format_func=lambda x: f"{x:g}x",
+                    disabled=st.session_state.camera_running
+                )
+                if st.button("Replay", disabled=st.session_state.camera_running):
+                    st.session_state.session_player = SessionPlayer(
+                        os.path.join(RECORDINGS_DIR, replay_name), speed=replay_speed
+                    )
+                    st.session_state.camera_running = True
+                    st.rerun()
+
+        col1, col2 = st.columns(2)
+        with col1:
+            if not st.session_state.camera_running:
+                if st.button("Start Camera", type="primary"):
+                    try:
+                        # The recorder is created first: if it fails, the
+                        # shared capture has not been touched yet.
+                        if record_session:
+                            # The random suffix keeps two sessions started in
+                            # the same second from sharing a directory.
+                            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+                            st.session_state.session_recorder = SessionRecorder(
+                                os.path.join(RECORDINGS_DIR, name), fps=target_fps
+                            )
+                        # Sessions share one capture and detection pipeline
+                        # per source; the first one to start it picks the
+                        # detection settings. A session that disappears
+                        # without stopping is dropped after 10 s.
+                        st.session_state.motion_subscription = motion_service.subscribe(
+                            CAMERA_SOURCE, maxsize=2, idle_timeout=10.0,
+                            processing_scale=processing_scale, roi_only=roi_only,
+                            engine=motion_engine, timer=camera_timers.get('pipeline'),
+                            target_fps=target_fps
+                        )
+                        camera_timer.reset()
                         st.session_state.camera_running = True
-                        st.experimental_rerun()
-                except Exception as e:
-                    st.error(f"Error starting camera: {str(e)}")
-        else:
-            if st.button("Stop Camera", type="primary"):
-                if st.session_state.motion_detector:
-                    st.session_state.motion_detector.stop_camera()
-                st.session_state.camera_running = False
-                st.experimental_rerun()
+                        st.rerun()
+                    except Exception as e:
+                        # Close whatever was opened before the failure.
+                        release_camera()
+                        st.error(f"Error starting camera: {str(e)}")
+            else:
+                if st.button("Stop Camera", type="primary"):
+                    release_camera()
+                    st.rerun()
     
-    if st.session_state.camera_running and st.session_state.motion_detector:
-        col1, col2 = st.columns(2)
+        if st.session_state.camera_running:
+            subscription = st.session_state.motion_subscription
+            player = st.session_state.session_player
+            recorder = st.session_state.session_recorder
+            if player is not None:
+                st.caption(f"Replaying {len(player)} recorded frames at {player.speed:g}x.")
+            elif subscription.settings['processing_scale'] != processing_scale or \
+                    subscription.settings['roi_only'] != roi_only or subscription.settings['engine'] != motion_engine:
+                st.caption("Another session started the shared camera; its detection settings are in use.")
+            col1, col2 = st.columns(2)
         
-        with col1:
-            camera_placeholder = st.empty()
+            with col1:
+                camera_placeholder = st.empty()
         
-        with col2:
-            brain_activity_placeholder = st.empty()
-        st.markdown("### Real-time Brain Signals")
-        c3_signal_placeholder = st.empty()
-        cz_signal_placeholder = st.empty()
-        c4_signal_placeholder = st.empty()
+            with col2:
+                brain_activity_placeholder = st.empty()
+            st.markdown("### Real-time Brain Signals")
+            c3_signal_placeholder = st.empty()
+            cz_signal_placeholder = st.empty()
+            c4_signal_placeholder = st.empty()
+            chart_placeholders = [brain_activity_placeholder, c3_signal_placeholder,
+                                  cz_signal_placeholder, c4_signal_placeholder]
+            chart_keys = ["brain_activity_plot", "c3_signal_plot", "cz_signal_plot", "c4_signal_plot"]
         
-        stop_button_placeholder = st.empty()
+            stop_button_placeholder = st.empty()
+            diagnostics_placeholder = st.empty()
         
-        try:
-            while st.session_state.camera_running:
-                frame = st.session_state.motion_detector.get_frame()
-                if frame is None:
-                    st.error("Failed to capture frame from camera")
-                    break
-                
-                processed_frame, _ = st.session_state.motion_detector.detect_motion(frame)
-                
-                active_brain_regions = st.session_state.motion_detector.get_active_brain_regions()
-                
-                rgb_frame = cv2.cvtColor(processed_frame, cv2.COLOR_BGR2RGB)
-                
-                camera_placeholder.image(rgb_frame, channels="RGB", use_container_width=True)
-                
-                brain_fig = go.Figure()
-                
-                for i, region in enumerate(['C3', 'Cz', 'C4']):
-                    info = active_brain_regions[region]
-                    color = 'rgba(255, 0, 0, 0.7)' if info['active'] else 'rgba(0, 0, 255, 0.7)'
-                    brain_fig.add_trace(go.Scatter(
-                        x=[i-0.4, i+0.4, i+0.4, i-0.4, i-0.4],
-                        y=[-0.4, -0.4, 0.4, 0.4, -0.4],
-                        fill="toself",
-                        fillcolor=color,
-                        line=dict(color='black'),
-                        mode='lines',
-                        name=region,
-                        text=f"{region}: {'Active' if info['active'] else 'Resting'}",
-                        hoverinfo='text'
-                    ))
-                    
-                    brain_fig.add_annotation(
-                        x=i, y=0,
-                        text=region,
-                        showarrow=False,
-                        font=dict(color='white', size=14)
-                    )
-                    
-                    if info['active']:
-                        brain_fig.add_annotation(
-                            x=i, y=0.6,
-                            text=f"Active: {info['body_part']}",
-                            showarrow=False,
-                            font=dict(color='black', size=12),
-                            bgcolor='rgba(255, 255, 255, 0.7)'
-                        )
-                brain_fig.update_layout(
-                    title="Brain Activity Based on Movement",
-                    xaxis=dict(showticklabels=False, range=[-1, 3]),
-                    yaxis=dict(showticklabels=False, range=[-1, 1]),
-                    showlegend=False,
-                    height=300,
-                    margin=dict(l=20, r=20, t=40, b=20)
-                )
-                
-                brain_activity_placeholder.plotly_chart(brain_fig, use_container_width=True, key="brain_activity_plot")
-                
-                region_idx = {'C3': 0, 'Cz': 1, 'C4': 2}
-                region_titles = {'C3': 'Left Brain (C3)', 'Cz': 'Middle Brain (Cz)', 'C4': 'Right Brain (C4)'}
-                
-                c3_info = active_brain_regions['C3']
-                c3_signal_data = trials[region_idx['C3']][0]
-                c3_fig = go.Figure()
-                
-                c3_signal_segment = st.session_state.motion_detector.generate_real_time_signal('C3', c3_signal_data, num_points=100)
-                
-                c3_fig.add_trace(go.Scatter(
-                    y=c3_signal_segment,
-                    mode='lines',
-                    name='C3',
-                    line=dict(color='red' if c3_info['active'] else 'blue', width=2)
-                ))
-                
-                c3_fig.update_layout(
-                    title=region_titles['C3'],
-                    yaxis_title="Signal Strength",
-                    xaxis_title="Time",
-                    height=150,
-                    margin=dict(l=20, r=20, t=40, b=20)
-                )
+            trials, classes = MotorImageryDataset(subject).get_trials_from_channels(
+                [7, 9, 11], clean=exclude_artifacts, eog=remove_eog
+            )
+            base_signals = np.stack([trials[0][0], trials[1][0], trials[2][0]])
+            streamer = SignalStreamer(base_signals, num_points=100)
+            live = LiveFigures(num_points=100)
+            # The shared pipeline already idles without motion; this pacer
+            # only caps the render rate and sheds rendering when over budget.
+            pacer = FramePacer(target_fps, idle_after=None)
+            last_report = 0.0
+            last_chart = 0.0
+            chart_pushes = 0
+        
+            try:
+                while st.session_state.camera_running:
+                    with camera_timer.stage('wait_result'):
+                        if player is not None:
+                            result = next(player, None)
+                        else:
+                            result = subscription.get_latest(timeout=1.0)
+                    if result is None:
+                        if player is not None:
+                            st.info("Replay finished")
+                        else:
+                            st.error("Failed to capture frame from camera")
+                        release_camera()
+                        break
+                    pacer.begin()
+                    render = pacer.should_process()
                 
-                cz_info = active_brain_regions['Cz']
-                cz_signal_data = trials[region_idx['Cz']][0]
-                cz_fig = go.Figure()
+                    processed_frame = result['frame']
+                    active_brain_regions = result['active_brain_regions']
                 
-                cz_signal_segment = st.session_state.motion_detector.generate_real_time_signal('Cz', cz_signal_data, num_points=100)
+                    if render:
+                        with camera_timer.stage('color_convert'):
+                            rgb_frame = cv2.cvtColor(processed_frame, cv2.COLOR_BGR2RGB)
+
+                        with camera_timer.stage('image_push'):
+                            engine_name = result['detection_info']['engine']
+                            camera_placeholder.image(rgb_frame, channels="RGB", use_container_width=True,
+                                                     caption=f"Engine: {ENGINES[engine_name].label}")
                 
-                cz_fig.add_trace(go.Scatter(
-                    y=cz_signal_segment,
-                    mode='lines',
-                    name='Cz',
-                    line=dict(color='red' if cz_info['active'] else 'blue', width=2)
-                ))
+                    with camera_timer.stage('signals'):
+                        if player is not None:
+                            signal_segments = result['traces']
+                        else:
+                            signal_segments = streamer.step(
+                                [active_brain_regions[region]['active'] for region in REGIONS]
+                            )
+
+                    if recorder is not None:
+                        with camera_timer.stage('record'):
+                            recorder.record(result, signal_segments)
                 
-                cz_fig.update_layout(
-                    title=region_titles['Cz'],
-                    yaxis_title="Signal Strength",
-                    xaxis_title="Time",
-                    height=150,
-                    margin=dict(l=20, r=20, t=40, b=20)
-                )
+                    # Charts refresh at their own rate, independent of the
+                    # video, and only figures whose data changed are re-sent.
+                    if render and time.perf_counter() - last_chart >= 1.0 / chart_rate:
+                        last_chart = time.perf_counter()
+                        with camera_timer.stage('figure_update'):
+                            changed = live.update(active_brain_regions, signal_segments)
+                        with camera_timer.stage('chart_push'):
+                            chart_pushes += 1
+                            for i in changed:
+                                chart_placeholders[i].plotly_chart(live.figures[i], use_container_width=True,
+                                                                   key=f"{chart_keys[i]}_{chart_pushes}")
                 
-                c4_info = active_brain_regions['C4']
-                c4_signal_data = trials[region_idx['C4']][0]
-                c4_fig = go.Figure()
+                    current_time = int(time.time() * 1000)
+                    if stop_button_placeholder.button("Stop Camera", key=f"stop_in_loop_{current_time}"):
+                        release_camera()
+                        break
                 
-                c4_signal_segment = st.session_state.motion_detector.generate_real_time_signal('C4', c4_signal_data, num_points=100)
+                    with camera_timer.stage('sleep'):
+                        pacer.wait()
+                    camera_timer.tick()
                 
-                c4_fig.add_trace(go.Scatter(
-                    y=c4_signal_segment,
-                    mode='lines',
-                    name='C4',
-                    line=dict(color='red' if c4_info['active'] else 'blue', width=2)
+                    # Reporting runs at most once a second so it stays out of the
+                    # numbers it reports.
+                    if time.perf_counter() - last_report >= 1.0:
+                        last_report = time.perf_counter()
+                        if show_diagnostics:
+                            summary = camera_timer.summary()
+                            if subscription is not None and subscription.service.timer is not None:
+                                # Detection runs once for all sessions, in the shared pipeline.
+                                for name, stage in subscription.service.timer.summary().items():
+                                    summary[f"pipeline: {name}"] = stage
+                            with diagnostics_placeholder.container(border=True):
+                                notes = [f"{camera_timer.fps():.1f} FPS", f"{pacer.skipped} renders skipped"]
+                                pipeline = subscription.service.pacer if subscription is not None else None
+                                if pipeline is not None:
+                                    notes.append(f"pipeline {pipeline.mode} ({pipeline.skipped} detections skipped)")
+                                if recorder is not None:
+                                    notes.append(f"{recorder.rows} frames recorded, {recorder.dropped} dropped")
+                                if player is not None:
+                                    notes.append(f"{player.skipped} late frames skipped")
+                                st.markdown("**Loop diagnostics** — " + ", ".join(notes))
+                                st.dataframe(
+                                    {
+                                        'stage': list(summary),
+                                        'p50 ms': [s['p50_ms'] for s in summary.values()],
+                                        'p95 ms': [s['p95_ms'] for s in summary.values()],
+                                        'p99 ms': [s['p99_ms'] for s in summary.values()],
+                                        'share': [f"{s['share']:.0%}" for s in summary.values()],
+                                    },
+                                    hide_index=True, use_container_width=True
+                                )
+            except Exception as e:
+                st.error(f"Error in camera processing: {str(e)}")
+                release_camera()
+    
+        if not st.session_state.camera_running:
+            st.info("Click 'Start Camera' to begin movement detection")
+
+if tab4.open:
+    import plotly.graph_objects as go
+    from decoding import DecodingStore
+
+    decoding_store = DecodingStore()
+
+    with tab4:
+        with st.container(border=True):
+            st.markdown("""
+            ### Motor Imagery Decoding
+            - Signals are band-pass filtered (8-30 Hz) over all 22 EEG channels
+            - **Common Spatial Patterns** find the channel mixes that best separate each movement
+            - **Linear Discriminant Analysis** predicts left hand, right hand, foot or tongue
+            """)
+        with st.container(border=True):
+            decoding_result = decoding_store.cached(subject, clean=exclude_artifacts, eog=remove_eog)
+            if decoding_result is None:
+                st.info("This subject has not been evaluated yet.")
+                if st.button("Run cross-validation", type="primary"):
+                    with st.spinner("Running 5-fold cross-validation..."):
+                        decoding_result = decoding_store.get(subject, n_jobs=-1, clean=exclude_artifacts,
+                                                             eog=remove_eog)
+
+            if decoding_result is not None:
+                acc_col, chance_col, fit_col, predict_col = st.columns(4)
+                acc_col.metric("Accuracy", f"{decoding_result['accuracy']:.1%}",
+                               f"±{decoding_result['accuracy_std']:.1%}", delta_color="off")
+                chance_col.metric("Chance level", f"{decoding_result['chance']:.1%}")
+                fit_col.metric("Training time", f"{decoding_result['fit_ms']:.0f} ms")
+                predict_col.metric("Prediction time", f"{decoding_result['predict_ms_per_trial']:.2f} ms/trial")
+
+                fig_folds = go.Figure(go.Bar(
+                    x=[f"Fold {i + 1}" for i in range(len(decoding_result['fold_accuracy']))],
+                    y=decoding_result['fold_accuracy'],
+                    marker_color='#2E86C1'
                 ))
-                
-                c4_fig.update_layout(
-                    title=region_titles['C4'],
-                    yaxis_title="Signal Strength",
-                    xaxis_title="Time",
-                    height=150,
-                    margin=dict(l=20, r=20, t=40, b=20)
+                fig_folds.add_hline(y=decoding_result['chance'], line_dash='dash', annotation_text="Chance")
+                fig_folds.update_layout(
+                    title=f"Cross-validation accuracy for {subject}",
+                    yaxis=dict(title="Accuracy", range=[0, 1]),
+                    height=350
                 )
-                
-                c3_signal_placeholder.plotly_chart(c3_fig, use_container_width=True, key="c3_signal_plot")
-                cz_signal_placeholder.plotly_chart(cz_fig, use_container_width=True, key="cz_signal_plot")
-                c4_signal_placeholder.plotly_chart(c4_fig, use_container_width=True, key="c4_signal_plot")
-                
-                current_time = int(time.time() * 1000)
-                if stop_button_placeholder.button("Stop Camera", key=f"stop_in_loop_{current_time}"):
-                    st.session_state.camera_running = False
-                    if st.session_state.motion_detector:
-                        st.session_state.motion_detector.stop_camera()
-                    break
-                
-                time.sleep(0.1)
-        except Exception as e:
-            st.error(f"Error in camera processing: {str(e)}")
-            st.session_state.camera_running = False
-            if st.session_state.motion_detector:
-                st.session_state.motion_detector.stop_camera()
-    
-    if not st.session_state.camera_running:
-        st.info("Click 'Start Camera' to begin movement detection")
-        
+                st.plotly_chart(fig_folds, use_container_width=True, key="decoding_folds_plot")
+
+        if decoding_result is not None:
+            with st.container(border=True):
+                st.markdown("""
+                ### Online Decoding Replay
+                The recording is fed to the decoder 100 ms at a time, as a headset would stream it.
+                Filters keep their state between blocks and a 2 s window is classified every 0.1 s.
+                """)
+                replay_seconds = st.slider("Seconds to replay", 10, 300, 60, step=10)
+                if st.button("Replay online", type="primary"):
+                    from online_decoder import online_model, run_replay
+
+                    dataset = MotorImageryDataset(subject)
+                    model = online_model(decoding_store, subject, clean=exclude_artifacts, eog=remove_eog)
+                    positions, probabilities, replay_stats = run_replay(
+                        dataset, model, block_size=25, stop=replay_seconds * dataset.Fs, eog=remove_eog
+                    )
+
+                    p50_col, p99_col, headroom_col = st.columns(3)
+                    p50_col.metric("Block latency (p50)", f"{replay_stats['p50_ms']:.2f} ms")
+                    p99_col.metric("Block latency (p99)", f"{replay_stats['p99_ms']:.2f} ms")
+                    headroom_col.metric("Real-time headroom", f"{replay_stats['realtime_factor']:.0f}x")
+
+                    fig_online = go.Figure()
+                    for k, code in enumerate(model.classes_):
+                        fig_online.add_trace(go.Scatter(
+                            x=positions / dataset.Fs,
+                            y=probabilities[:, k],
+                            mode='lines',
+                            name=dataset.mi_types[int(code)]
+                        ))
+                    trial_index = dataset.get_trial_index()
+                    for start, code in zip(trial_index['start'], trial_index['label']):
+                        cue = (start + 2 * dataset.Fs) / dataset.Fs
+                        if cue <= replay_seconds:
+                            fig_online.add_vline(x=cue, line_dash='dot', line_color='gray',
+                                                 annotation_text=dataset.mi_types[int(code)])
+                    fig_online.update_layout(
+                        title="Class probabilities over time",
+                        xaxis_title="Time (s)",
+                        yaxis=dict(title="Probability", range=[0, 1]),
+                        height=400
+                    )
+                    st.plotly_chart(fig_online, use_container_width=True, key="online_decoding_plot")
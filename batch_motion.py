@@ -0,0 +1,166 @@
+import argparse
+import csv
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from camera_utils import BRAIN_REGIONS, MotionDetector
+
+
+def probe(path):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise Exception(f"Could not open video {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    n_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return n_frames, fps
+
+
+def default_overlap(fps, engine='frame_diff', cooldown_time=0.5):
+    # Frames replayed before a chunk starts: enough for the engine to warm up
+    # and for activations from the previous chunk to run out their cooldown,
+    # so chunk boundaries are invisible in the timeline.
+    detector = MotionDetector(engine=engine)
+    return int(math.ceil(cooldown_time * fps)) + getattr(detector.engine, 'warmup', 0) + 1
+
+
+def plan_chunks(n_frames, chunk_frames, overlap):
+    # (warm, start, stop): frames warm..start-1 only prime the detector.
+    return [(max(0, start - overlap), start, min(start + chunk_frames, n_frames))
+            for start in range(0, n_frames, chunk_frames)]
+
+
+def analyze_chunk(path, warm, start, stop, fps, detector_kwargs):
+    detector = MotionDetector(**detector_kwargs)
+    cap = cv2.VideoCapture(path)
+    if warm:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, warm)
+
+    n = stop - start
+    frames = np.arange(start, stop)
+    active = np.zeros((n, len(BRAIN_REGIONS)), dtype=bool)
+    scores = np.zeros((n, len(BRAIN_REGIONS)), dtype=np.float32)
+
+    index = warm
+    while index < stop:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        detector.detect_motion(frame, timestamp=index / fps, draw=False)
+        if index >= start:
+            regions = detector.get_active_brain_regions()
+            row = index - start
+            for j, region in enumerate(BRAIN_REGIONS):
+                active[row, j] = regions[region]['active']
+                scores[row, j] = regions[region]['score']
+        index += 1
+    cap.release()
+
+    done = max(0, index - start)
+    return frames[:done], active[:done], scores[:done]
+
+
+def analyze_videos(paths, workers=None, chunk_seconds=60.0, overlap=None, **detector_kwargs):
+    # Splits every video into chunks and runs them all on one process pool.
+    # Returns {path: timeline}, where a timeline holds per-frame arrays
+    # `frame`, `time`, `active` (frames, 3) and `score` (frames, 3) in
+    # BRAIN_REGIONS order.
+    plans = {}
+    for path in paths:
+        n_frames, fps = probe(path)
+        chunk_frames = max(1, int(chunk_seconds * fps))
+        warmup = default_overlap(fps, detector_kwargs.get('engine', 'frame_diff')) if overlap is None else overlap
+        plans[path] = (fps, plan_chunks(n_frames, chunk_frames, warmup))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {path: [pool.submit(analyze_chunk, path, *chunk, fps, detector_kwargs) for chunk in chunks]
+                   for path, (fps, chunks) in plans.items()}
+        timelines = {}
+        for path, chunk_futures in futures.items():
+            frames, active, scores = zip(*(f.result() for f in chunk_futures))
+            fps = plans[path][0]
+            frames = np.concatenate(frames)
+            timelines[path] = {
+                'fps': fps,
+                'frame': frames,
+                'time': frames / fps,
+                'active': np.concatenate(active),
+                'score': np.concatenate(scores),
+            }
+    return timelines
+
+
+def active_segments(timeline):
+    # Run-length encode each region's activity into [start_s, end_s] spans.
+    segments = {}
+    for j, region in enumerate(BRAIN_REGIONS):
+        edges = np.diff(np.r_[0, timeline['active'][:, j].astype(np.int8), 0])
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        times = np.r_[timeline['time'], timeline['time'][-1] + 1 / timeline['fps']] if len(timeline['time']) else []
+        segments[region] = [[round(float(times[s]), 3), round(float(times[e]), 3)] for s, e in zip(starts, ends)]
+    return segments
+
+
+def write_csv(timelines, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['video', 'frame', 'time_s', *BRAIN_REGIONS, *(f"{r}_score" for r in BRAIN_REGIONS)])
+        for video, t in timelines.items():
+            name = os.path.basename(video)
+            for frame, seconds, active, score in zip(t['frame'].tolist(), t['time'].tolist(),
+                                                     t['active'].astype(np.int8).tolist(),
+                                                     np.round(t['score'], 4).tolist()):
+                writer.writerow([name, frame, f"{seconds:.3f}", *active, *score])
+
+
+def write_json(timelines, path):
+    # Columnar per video, plus active spans for quick inspection.
+    out = {}
+    for video, t in timelines.items():
+        out[os.path.basename(video)] = {
+            'fps': t['fps'],
+            'frames': int(len(t['frame'])),
+            'regions': list(BRAIN_REGIONS),
+            'active': {r: t['active'][:, j].astype(np.int8).tolist() for j, r in enumerate(BRAIN_REGIONS)},
+            'score': {r: np.round(t['score'][:, j], 4).tolist() for j, r in enumerate(BRAIN_REGIONS)},
+            'segments': active_segments(t),
+        }
+    with open(path, 'w') as f:
+        json.dump(out, f, separators=(',', ':'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless motion analysis of recorded videos.")
+    parser.add_argument('videos', nargs='+')
+    parser.add_argument('--output', default='motion_timeline.csv', help="Timeline file (.csv or .json)")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-seconds', type=float, default=60.0)
+    parser.add_argument('--overlap', type=int, default=None, help="Warm-up frames before each chunk")
+    parser.add_argument('--scale', type=float, default=0.5, help="Processing resolution")
+    parser.add_argument('--full-frame', action='store_true', help="Process the whole frame, not just body regions")
+    parser.add_argument('--engine', default='frame_diff')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    timelines = analyze_videos(args.videos, workers=args.workers, chunk_seconds=args.chunk_seconds,
+                               overlap=args.overlap, processing_scale=args.scale,
+                               roi_only=not args.full_frame, engine=args.engine)
+    elapsed = time.perf_counter() - start
+
+    (write_json if args.output.endswith('.json') else write_csv)(timelines, args.output)
+
+    frames = sum(len(t['frame']) for t in timelines.values())
+    seconds = sum(len(t['frame']) / t['fps'] for t in timelines.values())
+    print(f"{len(timelines)} videos, {frames} frames ({seconds:.0f}s of footage) in {elapsed:.2f}s "
+          f"({seconds / elapsed:.1f}x real time, {frames / elapsed:.0f} frames/s)")
+    print(f"Timeline written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Runs in a fresh interpreter so every module the app imports is really cold.
+# Streamlit itself is imported before the clock starts: a running server
+# already has it loaded.
+SESSION = r'''
+import json, sys, time
+sys.path.insert(0, {root!r})
+from streamlit.testing.v1 import AppTest
+
+timings = {{}}
+
+def timed(name, action):
+    start = time.perf_counter()
+    action()
+    timings[name] = (time.perf_counter() - start) * 1000
+    if at.exception:
+        raise SystemExit(f"{{name}}: {{at.exception[0].value}}")
+
+def open_view(label):
+    at.session_state['view'] = label
+    at.run()
+
+at = AppTest.from_file({app!r}, default_timeout=600)
+timed('cold_start', at.run)
+timed('rerun', at.run)
+for name, label in {views!r}:
+    timed(f'open:{{name}}', lambda: open_view(label))
+    timed(f'rerun:{{name}}', at.run)
+timed('switch_subject', lambda: at.sidebar.selectbox[0].select('A02T').run())
+print(json.dumps(timings))
+'''
+
+VIEWS = [
+    ('activity_map', 'Brain Activity Map'),
+    ('signals', 'Brain Signals Explorer'),
+    ('movement', 'Movement Detection'),
+    ('decoding', 'Motor Imagery Decoding'),
+]
+
+
+def run_session(app, data_dir):
+    code = SESSION.format(root=str(ROOT), app=str(app), views=VIEWS)
+    out = subprocess.run([sys.executable, '-c', code], cwd=data_dir, capture_output=True, text=True)
+    if out.returncode:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else out.stdout)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure app.py cold start and per-interaction rerun time.")
+    parser.add_argument('--app', type=Path, default=ROOT / 'app.py')
+    parser.add_argument('--data-dir', help="Directory with A01T.npz and A02T.npz (synthetic subjects if omitted)")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', type=Path, help="Write the median timings as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        data_dir = args.data_dir
+        if data_dir is None:
+            sys.path.insert(0, str(Path(__file__).resolve().parent))
+            from synthetic import make_subject
+            data_dir = workdir
+            for subject in ('A01T', 'A02T'):
+                make_subject(os.path.join(workdir, f"{subject}.npz"), seed=int(subject[2]))
+
+        runs = [run_session(args.app.resolve(), data_dir) for _ in range(args.repeat)]
+
+    medians = {name: statistics.median(run[name] for run in runs) for name in runs[0]}
+    print(f"{'step':<30} {'median ms':>10} {'min ms':>10}")
+    for name, value in medians.items():
+        print(f"{name:<30} {value:10.1f} {min(run[name] for run in runs):10.1f}")
+    if args.output:
+        args.output.write_text(json.dumps(medians, indent=2))
+
+
+if __name__ == '__main__':
+    main()
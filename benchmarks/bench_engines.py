@@ -0,0 +1,95 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from camera_utils import FrameSource, MotionDetector, synthetic_frames
+from motion_engines import ENGINES
+
+
+# Synthetic clips with the body region that should be active in every frame
+# (None means the scene is static apart from sensor noise).
+SYNTHETIC_CLIPS = {
+    'right_hand_motion': (dict(region=(0.6, 0.35, 0.9, 0.65), noise=8), 'right_hand'),
+    'head_motion': (dict(region=(0.35, 0.05, 0.65, 0.25), noise=8), 'head'),
+    'static_noisy': (dict(region=(0.6, 0.35, 0.9, 0.65), noise=40, speed=0), None),
+}
+
+
+def load_clip(source, n_frames):
+    frames = []
+    frame_source = FrameSource(source, realtime=False)
+    while len(frames) < n_frames:
+        frame = frame_source.read()
+        if frame is None:
+            break
+        frames.append(frame)
+    frame_source.release()
+    return frames
+
+
+def run_engine(engine, frames, expected, processing_scale, roi_only):
+    detector = MotionDetector(processing_scale=processing_scale, roi_only=roi_only, engine=engine)
+    # Cooldown would smear detections across frames and hide flicker.
+    detector.cooldown_time = 0
+
+    latencies = []
+    states = []
+    for frame in frames:
+        frame = frame.copy()
+        start = time.perf_counter()
+        _, active = detector.detect_motion(frame)
+        latencies.append(time.perf_counter() - start)
+        states.append([bool(active.get(region)) for region in detector.body_regions])
+
+    latencies = np.array(latencies) * 1000
+    states = np.array(states)
+    result = {
+        'engine': engine,
+        'p50_ms': np.percentile(latencies, 50),
+        'p95_ms': np.percentile(latencies, 95),
+        'fps': 1000 / latencies.mean(),
+        # State flips per frame, averaged over regions: lower is steadier.
+        'flicker': np.abs(np.diff(states.astype(np.int8), axis=0)).mean() if len(states) > 1 else 0.0,
+    }
+
+    if expected is not False:
+        truth = np.zeros_like(states)
+        if expected is not None:
+            truth[:, list(detector.body_regions).index(expected)] = True
+        warm = states[len(states) // 10:]
+        truth = truth[len(states) // 10:]
+        result['hit_rate'] = warm[truth].mean() if truth.any() else float('nan')
+        result['false_rate'] = warm[~truth].mean()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare motion background-model engines.")
+    parser.add_argument('videos', nargs='*', help="Recorded clips to benchmark in addition to the synthetic ones")
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--scale', type=float, default=1.0, help="Processing resolution")
+    parser.add_argument('--roi-only', action='store_true')
+    parser.add_argument('--engines', nargs='+', default=list(ENGINES), choices=list(ENGINES))
+    args = parser.parse_args()
+
+    clips = [(name, list(synthetic_frames(n_frames=args.frames, seed=i, **kwargs)), expected)
+             for i, (name, (kwargs, expected)) in enumerate(SYNTHETIC_CLIPS.items())]
+    clips += [(Path(video).name, load_clip(video, args.frames), False) for video in args.videos]
+
+    header = f"{'clip':<20} {'engine':<16} {'p50 ms':>7} {'p95 ms':>7} {'fps':>7} {'flicker':>8} {'hit':>6} {'false':>6}"
+    print(header)
+    print('-' * len(header))
+    for name, frames, expected in clips:
+        for engine in args.engines:
+            r = run_engine(engine, frames, expected, args.scale, args.roi_only)
+            print(f"{name:<20} {engine:<16} {r['p50_ms']:7.2f} {r['p95_ms']:7.2f} {r['fps']:7.0f} "
+                  f"{r['flicker']:8.3f} {r.get('hit_rate', float('nan')):6.2f} {r.get('false_rate', float('nan')):6.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from camera_utils import MotionDetector, synthetic_frames
+from dataset_utils import DatasetCache, MotorImageryDataset, convert_to_mapped
+from figures import LiveFigures, live_figures
+from heatmap_utils import HeatmapPyramid
+from time_frequency import compute_erd
+from synthetic import make_subject
+
+BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+CASES = {}
+
+
+def case(name, iterations):
+    # Registers a setup function; it receives the shared context and returns
+    # the zero-argument callable that is timed.
+    def register(setup):
+        CASES[name] = (setup, iterations)
+        return setup
+    return register
+
+
+class Context:
+    def __init__(self, workdir):
+        self.subject = make_subject(os.path.join(workdir, 'A01T.npz'))
+        self.mapped = convert_to_mapped(self.subject, os.path.join(workdir, 'mapped', 'A01T.mmap'))
+        self.frames = list(synthetic_frames(n_frames=64))
+        self.dataset = MotorImageryDataset(self.subject, cache=DatasetCache())
+
+
+@case('dataset_load', iterations=5)
+def _dataset_load(ctx):
+    # np.load plus transposes, with a cold cache every time.
+    return lambda: MotorImageryDataset(ctx.subject, cache=DatasetCache())
+
+
+@case('dataset_load_cached', iterations=200)
+def _dataset_load_cached(ctx):
+    cache = DatasetCache()
+    MotorImageryDataset(ctx.subject, cache=cache)
+    return lambda: MotorImageryDataset(ctx.subject, cache=cache)
+
+
+@case('dataset_load_mapped', iterations=200)
+def _dataset_load_mapped(ctx):
+    return lambda: MotorImageryDataset(ctx.mapped, cache=DatasetCache())
+
+
+@case('trials_from_channels_mapped', iterations=50)
+def _trials_from_channels_mapped(ctx):
+    dataset = MotorImageryDataset(ctx.mapped, cache=DatasetCache())
+
+    def run():
+        dataset.cache = DatasetCache()
+        dataset.get_trials_from_channels([7, 9, 11])
+    return run
+
+
+@case('trials_from_channels', iterations=50)
+def _trials_from_channels(ctx):
+    def run():
+        ctx.dataset.cache = DatasetCache()
+        ctx.dataset.get_trials_from_channels([7, 9, 11])
+    return run
+
+
+@case('epochs_all_channels_f32', iterations=10)
+def _epochs_all_channels(ctx):
+    def run():
+        ctx.dataset.cache = DatasetCache()
+        ctx.dataset.get_epochs(dtype=np.float32)
+    return run
+
+
+@case('eog_regression', iterations=5)
+def _eog_regression(ctx):
+    def run():
+        ctx.dataset.cache = DatasetCache()
+        ctx.dataset.get_eog_corrected()
+    return run
+
+
+@case('select_clean_trials', iterations=200)
+def _select_clean_trials(ctx):
+    ctx.dataset.get_trial_index()
+    return lambda: ctx.dataset.select_trials('right')
+
+
+def _detect(ctx, **kwargs):
+    detector = MotionDetector(**kwargs)
+    frames = iter(ctx.frames * 1000)
+    return lambda: detector.detect_motion(next(frames).copy())
+
+
+@case('detect_motion_640x480', iterations=300)
+def _detect_motion(ctx):
+    return _detect(ctx)
+
+
+@case('detect_motion_640x480_half_roi', iterations=300)
+def _detect_motion_fast(ctx):
+    return _detect(ctx, processing_scale=0.5, roi_only=True)
+
+
+@case('generate_real_time_signals', iterations=2000)
+def _generate_signals(ctx):
+    detector = MotionDetector()
+    trials, _ = ctx.dataset.get_trials_from_channels([7, 9, 11])
+    base = np.stack([t[0] for t in trials])
+    return lambda: detector.generate_real_time_signals(base)
+
+
+def _live_inputs(ctx):
+    detector = MotionDetector()
+    trials, _ = ctx.dataset.get_trials_from_channels([7, 9, 11])
+    segments = detector.generate_real_time_signals(np.stack([t[0] for t in trials]))
+    regions = detector.get_active_brain_regions()
+    regions['C3'].update(active=True, body_part='right_hand')
+    return regions, segments
+
+
+@case('live_figures_build', iterations=100)
+def _figures_build(ctx):
+    regions, segments = _live_inputs(ctx)
+    return lambda: live_figures(regions, segments)
+
+
+@case('live_figures_build_and_serialize', iterations=100)
+def _figures_serialize(ctx):
+    regions, segments = _live_inputs(ctx)
+    return lambda: [fig.to_json() for fig in live_figures(regions, segments)]
+
+
+@case('live_figures_update_and_serialize', iterations=300)
+def _figures_update(ctx):
+    regions, segments = _live_inputs(ctx)
+    live = LiveFigures()
+    rng = np.random.default_rng(0)
+
+    def run():
+        # Fresh signal values every call, as in the camera loop.
+        changed = live.update(regions, segments + rng.standard_normal(segments.shape))
+        return [live.figures[i].to_dict() for i in changed]
+    return run
+
+
+@case('heatmap_pyramid_build', iterations=20)
+def _heatmap_build(ctx):
+    trials, _ = ctx.dataset.get_trials_from_channels([7])
+    return lambda: HeatmapPyramid(trials[0])
+
+
+@case('erd_stft_3ch', iterations=5)
+def _erd_stft(ctx):
+    return lambda: compute_erd(ctx.dataset, method='stft')
+
+
+@case('erd_morlet_3ch', iterations=3)
+def _erd_morlet(ctx):
+    return lambda: compute_erd(ctx.dataset, method='morlet')
+
+
+def measure(setup, iterations, ctx, min_time=0.5):
+    fn = setup(ctx)
+    fn()
+
+    latencies = []
+    start = time.perf_counter()
+    while len(latencies) < iterations or time.perf_counter() - start < min_time:
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+        if len(latencies) >= 20 * iterations:
+            break
+
+    # Peak memory is taken on a separate call so tracing does not skew the
+    # timings.
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    latencies = np.array(latencies) * 1000
+    return {
+        'iterations': len(latencies),
+        'ops_per_s': float(1000 / latencies.mean()),
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p95_ms': float(np.percentile(latencies, 95)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'peak_mb': peak / 2**20,
+    }
+
+
+def compare(results, baseline, tolerance, min_delta_ms=0.1):
+    regressions = []
+    print(f"\n{'case':<34} {'p50 ms':>9} {'baseline':>9} {'change':>8}")
+    for name, r in results.items():
+        old = baseline.get('results', {}).get(name)
+        if old is None:
+            print(f"{name:<34} {r['p50_ms']:9.3f} {'-':>9} {'new':>8}")
+            continue
+        change = r['p50_ms'] / old['p50_ms'] - 1
+        flag = ''
+        # Sub-millisecond cases swing by tens of percent on scheduler noise
+        # alone, so a slowdown also has to exceed an absolute floor.
+        if change > tolerance and r['p50_ms'] - old['p50_ms'] > min_delta_ms:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:<34} {r['p50_ms']:9.3f} {old['p50_ms']:9.3f} {change:+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dataset, detection and rendering hot paths.")
+    parser.add_argument('cases', nargs='*', help=f"Subset of cases to run ({', '.join(CASES)})")
+    parser.add_argument('--baseline', type=Path, default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="Overwrite the baseline with this run")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed p50 slowdown before failing")
+    parser.add_argument('--min-delta-ms', type=float, default=0.1,
+                        help="Smallest absolute p50 slowdown counted as a regression")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per case; the fastest p50 is kept")
+    parser.add_argument('--output', type=Path, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    names = args.cases or list(CASES)
+    unknown = set(names) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        ctx = Context(workdir)
+        print(f"{'case':<34} {'ops/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'peak MB':>8}")
+        for name in names:
+            setup, iterations = CASES[name]
+            runs = [measure(setup, iterations, ctx) for _ in range(max(1, args.repeat))]
+            r = results[name] = min(runs, key=lambda run: run['p50_ms'])
+            print(f"{name:<34} {r['ops_per_s']:10.1f} {r['p50_ms']:9.3f} {r['p95_ms']:9.3f} "
+                  f"{r['p99_ms']:9.3f} {r['peak_mb']:8.1f}")
+
+    report = {'machine': platform.platform(), 'python': platform.python_version(), 'results': results}
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        if args.baseline.exists() and args.cases:
+            previous = json.loads(args.baseline.read_text())
+            previous['results'].update(results)
+            report['results'] = previous['results']
+        args.baseline.write_text(json.dumps(report, indent=2) + '\n')
+        print(f"\nBaseline saved to {args.baseline}")
+    elif args.baseline.exists():
+        regressions = compare(results, json.loads(args.baseline.read_text()), args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) beyond {args.tolerance:.0%} and {args.min_delta_ms} ms: "
+                  f"{', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
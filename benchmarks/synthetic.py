@@ -0,0 +1,35 @@
+import numpy as np
+
+START_TRIAL = 768
+REJECTED_TRIAL = 1023
+
+
+def make_subject(path, n_trials=288, n_channels=25, fs=250, trial_spacing=2000, seed=0):
+    # A recording shaped like the BCI Competition IV 2a files: 's' is
+    # (samples, channels); etyp/epos/edur are (events, 1). Each trial has a
+    # 768 start event followed by its class cue, and every 37th trial is
+    # marked rejected (1023) with the artifact flag set.
+    rng = np.random.default_rng(seed)
+    lead = 10 * fs
+    n_samples = lead + n_trials * trial_spacing + 5 * fs
+    s = rng.standard_normal((n_samples, n_channels)) * 10
+
+    etyp, epos, edur = [32766, 276, 277], [0, 10, 1000], [0, 500, 500]
+    artifacts = np.zeros(n_trials, dtype=np.uint8)
+    for i in range(n_trials):
+        position = lead + i * trial_spacing
+        etyp.append(START_TRIAL)
+        epos.append(position)
+        edur.append(1875)
+        if i % 37 == 5:
+            etyp.append(REJECTED_TRIAL)
+            epos.append(position)
+            edur.append(1875)
+            artifacts[i] = 1
+        etyp.append(769 + i % 4)
+        epos.append(position + 2 * fs)
+        edur.append(313)
+
+    np.savez(path, s=s, etyp=np.array(etyp)[:, None], epos=np.array(epos)[:, None],
+             edur=np.array(edur)[:, None], artifacts=artifacts[:, None])
+    return path
@@ -1,9 +1,241 @@
 import cv2
+import threading
 import time
 
+import numpy as np
+
+from motion_engines import create_engine
+
+# The motor-cortex electrodes body motion is mapped to, left to right.
+BRAIN_REGIONS = ('C3', 'Cz', 'C4')
+
+
+def synthetic_frames(width=640, height=480, n_frames=None, region=(0.6, 0.35, 0.9, 0.65),
+                     noise=8, seed=0, speed=1.0):
+    # Static noisy background with a bright block sweeping inside `region`
+    # (fractions of the frame, same convention as MotionDetector.body_regions).
+    rng = np.random.default_rng(seed)
+    background = rng.integers(60, 120, size=(height, width, 3), dtype=np.uint8)
+    rx1, ry1, rx2, ry2 = region
+    x1, y1, x2, y2 = int(rx1 * width), int(ry1 * height), int(rx2 * width), int(ry2 * height)
+    block = max(8, (x2 - x1) // 4)
+
+    i = 0
+    while n_frames is None or i < n_frames:
+        frame = background.copy()
+        if noise:
+            frame += rng.integers(0, noise, size=frame.shape, dtype=np.uint8)
+        span = max(1, x2 - x1 - block)
+        bx = x1 + int(span * (0.5 + 0.5 * np.sin(i * speed / 5)))
+        by = y1 + (y2 - y1 - block) // 2
+        frame[by:by + block, bx:bx + block] = 255
+        yield frame
+        i += 1
+
+
+class FrameSource:
+    # Uniform read()/release() over a camera index, a video file path or any
+    # iterable of BGR frames. Video files are paced to their own frame rate
+    # when `realtime` is set so they behave like a live camera.
+    def __init__(self, source=0, width=640, height=480, realtime=None):
+        self.source = source
+        self.cap = None
+        self.frames = None
+        self.interval = 0
+        self._next_time = None
+
+        if isinstance(source, (int, str)):
+            self.cap = cv2.VideoCapture(source)
+            if not self.cap.isOpened():
+                raise Exception("Could not open video device")
+            if isinstance(source, int):
+                self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+                self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+            elif realtime is None or realtime:
+                fps = self.cap.get(cv2.CAP_PROP_FPS)
+                self.interval = 1.0 / fps if fps and fps > 0 else 0
+        else:
+            self.frames = iter(source() if callable(source) else source)
+            if realtime:
+                self.interval = 1.0 / realtime
+
+    def read(self):
+        if self.interval:
+            now = time.perf_counter()
+            if self._next_time is not None and self._next_time > now:
+                time.sleep(self._next_time - now)
+            self._next_time = max(now, self._next_time or now) + self.interval
+
+        if self.cap is not None:
+            ret, frame = self.cap.read()
+            return frame if ret else None
+        return next(self.frames, None)
+
+    def release(self):
+        if self.cap is not None and self.cap.isOpened():
+            self.cap.release()
+
+
+class FrameRingBuffer:
+    # Fixed number of preallocated frame slots. The writer never blocks: it
+    # overwrites the oldest slot, and readers only ever see the newest frame,
+    # so stale frames are dropped instead of queueing up.
+    def __init__(self, size=4):
+        self.size = size
+        self.slots = None
+        self.seq = 0
+        self.read_seq = 0
+        self.dropped = 0
+        self.closed = False
+        self._cond = threading.Condition()
+
+    def write(self, frame, flip=False):
+        with self._cond:
+            if self.slots is None or self.slots.shape[1:] != frame.shape:
+                self.slots = np.empty((self.size,) + frame.shape, dtype=frame.dtype)
+            slot = self.slots[self.seq % self.size]
+            if flip:
+                cv2.flip(frame, 1, dst=slot)
+            else:
+                np.copyto(slot, frame)
+
+            if self.seq > self.read_seq:
+                self.dropped += 1
+            self.seq += 1
+            self._cond.notify_all()
+
+    def read_latest(self, last_seq=0, timeout=None):
+        # Returns (seq, frame) for the newest frame written after `last_seq`,
+        # or (last_seq, None) on timeout or once the buffer is closed and
+        # drained.
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.seq > last_seq or self.closed, timeout):
+                return last_seq, None
+            if self.seq <= last_seq:
+                return last_seq, None
+            self.read_seq = self.seq
+            return self.seq, self.slots[(self.seq - 1) % self.size].copy()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class CaptureThread(threading.Thread):
+    def __init__(self, source, ring, flip=False):
+        super().__init__(daemon=True)
+        self.source = source
+        self.ring = ring
+        self.flip = flip
+        self.frames_read = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        try:
+            while not self._stop_event.is_set():
+                frame = self.source.read()
+                if frame is None:
+                    break
+                self.ring.write(frame, flip=self.flip)
+                self.frames_read += 1
+        finally:
+            self.source.release()
+            self.ring.close()
+
+    def stop(self, timeout=1.0):
+        self._stop_event.set()
+        if self.is_alive():
+            self.join(timeout)
+
+
+class SignalStreamer:
+    # Streams several regions side by side through their base signals. Each
+    # step advances every region by `hop` samples, modulates them towards the
+    # active or resting waveform with a per-sample exponential blend, and
+    # appends them to a ring buffer. Samples are written twice (at i and i + N)
+    # so the latest window is always the contiguous view buffer[:, w:w + N].
+    def __init__(self, base_signals, num_points=100, hop=25, blend_rate=0.05,
+                 active_gain=1.75, rest_gain=0.85):
+        self.base = np.nan_to_num(np.atleast_2d(np.asarray(base_signals, dtype=np.float64)))
+        self.num_points = num_points
+        self.hop = hop
+        self.decay = 1.0 - blend_rate
+        self.active_gain = active_gain
+        self.rest_gain = rest_gain
+
+        t = np.linspace(0, 2*np.pi, num_points)
+        self.active_wave = 0.3 * np.sin(10*t) + 0.2 * np.sin(15*t)
+        self.rest_wave = 0.2 * np.sin(2*t)
+
+        n_regions = len(self.base)
+        self.position = np.zeros(n_regions, dtype=np.int64)
+        self.blend = np.zeros(n_regions)
+        self.phase = 0
+        self.write = 0
+        self.buffer = np.empty((n_regions, 2 * num_points))
+        self._steps = np.arange(1, max(hop, num_points) + 1)
+        self.step(np.zeros(n_regions, dtype=bool), n=num_points)
+
+    def step(self, active, n=None):
+        n = self.hop if n is None else n
+        k = self._steps[:n] if n <= len(self._steps) else np.arange(1, n + 1)
+        target = np.asarray(active, dtype=np.float64)[:, None]
+        blend = target + (self.blend[:, None] - target) * self.decay ** k
+        self.blend = blend[:, -1]
+
+        idx = (self.position[:, None] + k - 1) % self.base.shape[1]
+        samples = np.take_along_axis(self.base, idx, axis=1)
+        self.position = (self.position + n) % self.base.shape[1]
+
+        phase = (self.phase + k - 1) % self.num_points
+        self.phase = (self.phase + n) % self.num_points
+        gain = self.rest_gain + blend * (self.active_gain - self.rest_gain)
+        modulation = self.rest_wave[phase] + blend * (self.active_wave[phase] - self.rest_wave[phase])
+        values = samples * gain + modulation
+
+        # Only the last num_points samples can still be visible.
+        values = values[:, -self.num_points:]
+        cols = (self.write + n - values.shape[1] + np.arange(values.shape[1])) % self.num_points
+        self.buffer[:, cols] = values
+        self.buffer[:, cols + self.num_points] = values
+        self.write = (self.write + n) % self.num_points
+        return self.window()
+
+    def window(self):
+        return self.buffer[:, self.write:self.write + self.num_points]
+
+
+def _contour_stats(contours):
+    # Bounding box and area of every contour at once, as rows of
+    # (x, y, w, h, area) matching cv2.boundingRect and cv2.contourArea.
+    if not contours:
+        return np.empty((0, 5), dtype=np.float64)
+
+    lengths = np.fromiter(map(len, contours), dtype=np.intp, count=len(contours))
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    points = np.concatenate(contours).reshape(-1, 2).astype(np.int64)
+    px, py = points[:, 0], points[:, 1]
+
+    left, top = np.minimum.reduceat(px, starts), np.minimum.reduceat(py, starts)
+    right, bottom = np.maximum.reduceat(px, starts), np.maximum.reduceat(py, starts)
+
+    # Shoelace formula, closing each polygon back onto its first point.
+    following = np.arange(1, len(points) + 1)
+    following[starts + lengths - 1] = starts
+    cross = px * py[following] - px[following] * py
+    area = np.abs(np.add.reduceat(cross, starts)) / 2.0
+
+    return np.stack([left, top, right - left + 1, bottom - top + 1, area], axis=1)
+
+
 class MotionDetector:
-    def __init__(self):
+    def __init__(self, processing_scale=1.0, roi_only=False, engine='frame_diff'):
         self.prev_frame = None
+        self.engine = create_engine(engine)
+        self.processing_scale = processing_scale
+        self.roi_only = roi_only
+        self._geometry_cache = {}
         self.motion_threshold = 20
         self.min_contour_area = 400
         self.body_regions = {
@@ -12,62 +244,129 @@ class MotionDetector:
             'head': {'region': (0.25, 0.0, 0.75, 0.3), 'brain_area': 'Cz', 'description': 'Middle of brain (Cz)'}
         }
         self.active_regions = {region: False for region in self.body_regions}
+        self.region_scores = {region: 0.0 for region in self.body_regions}
+        self.detection_info = {'engine': self.engine.name, 'contours': 0}
+        self.signal_streamer = None
+        self.region_streamers = {}
         self.cooldown = {region: 0 for region in self.body_regions}
         self.cooldown_time = 0.5
     
-    def start_camera(self):
-        
-        self.cap = cv2.VideoCapture(0)
-        if not self.cap.isOpened():
-            raise Exception("Could not open video device")
-        
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-        return self.cap.isOpened()
+    def start_camera(self, source=0, buffer_size=4, realtime=None, mirror=None):
+        
+        self.stop_camera()
+        frame_source = FrameSource(source, realtime=realtime)
+        if mirror is None:
+            mirror = isinstance(source, int)
+        
+        self.ring = FrameRingBuffer(buffer_size)
+        self.capture = CaptureThread(frame_source, self.ring, flip=mirror)
+        self.last_seq = 0
+        self.capture.start()
+        return True
     
     def stop_camera(self):
         
-        if hasattr(self, 'cap') and self.cap.isOpened():
-            self.cap.release()
+        if getattr(self, 'capture', None) is not None:
+            self.capture.stop()
+            self.capture = None
     
-    def get_frame(self):
-        
-        if not hasattr(self, 'cap') or not self.cap.isOpened():
-            return None
+    def get_frame(self, timeout=1.0):
         
-        ret, frame = self.cap.read()
-        if not ret:
+        if getattr(self, 'ring', None) is None:
             return None
         
-        
-        frame = cv2.flip(frame, 1)
+        self.last_seq, frame = self.ring.read_latest(self.last_seq, timeout)
         return frame
     
-    def detect_motion(self, frame):
+    def _geometry(self, height, width):
+        # Everything derived from the frame size and the detector settings is
+        # computed once per shape instead of once per frame.
+        key = (height, width, self.processing_scale, self.roi_only, self.min_contour_area,
+               self.engine.blur)
+        geometry = self._geometry_cache.get(key)
+        if geometry is not None:
+            return geometry
+
+        regions = {}
+        for region_name, region_info in self.body_regions.items():
+            rx1, ry1, rx2, ry2 = region_info['region']
+            regions[region_name] = (int(rx1 * width), int(ry1 * height),
+                                    int(rx2 * width), int(ry2 * height))
+
+        if self.roi_only:
+            rects = list(regions.values())
+            roi = (min(r[0] for r in rects), min(r[1] for r in rects),
+                   max(r[2] for r in rects), max(r[3] for r in rects))
+        else:
+            roi = (0, 0, width, height)
+
+        scale = self.processing_scale
+        size = (max(1, int(round((roi[2] - roi[0]) * scale))),
+                max(1, int(round((roi[3] - roi[1]) * scale))))
+        blur = max(3, int(round(self.engine.blur * scale)) | 1)
+
+        mask = None
+        if self.roi_only:
+            mask = np.zeros((size[1], size[0]), dtype=np.uint8)
+            for x1, y1, x2, y2 in regions.values():
+                mask[int((y1 - roi[1]) * scale):int(np.ceil((y2 - roi[1]) * scale)) + 1,
+                     int((x1 - roi[0]) * scale):int(np.ceil((x2 - roi[0]) * scale)) + 1] = 255
+
+        # Region bounds as arrays, in frame coordinates for the centre test and
+        # in processing coordinates for the integral-image box sums.
+        names = list(regions)
+        bounds = np.array([regions[name] for name in names], dtype=np.int64)
+        box = np.empty_like(bounds)
+        box[:, [0, 2]] = np.clip(np.round((bounds[:, [0, 2]] - roi[0]) * scale), 0, size[0])
+        box[:, [1, 3]] = np.clip(np.round((bounds[:, [1, 3]] - roi[1]) * scale), 0, size[1])
+        areas = np.maximum((box[:, 2] - box[:, 0]) * (box[:, 3] - box[:, 1]), 1)
+
+        geometry = {
+            'regions': regions,
+            'names': names,
+            'bounds': bounds,
+            'box': box,
+            'areas': areas,
+            'roi': roi,
+            'size': size,
+            'blur': (blur, blur),
+            'mask': mask,
+            'min_area': self.min_contour_area * scale * scale,
+        }
+        self._geometry_cache = {key: geometry}
+        return geometry
+
+    def detect_motion(self, frame, timestamp=None, draw=True):
+        # `timestamp` (seconds) drives the activation cooldown; recorded video
+        # passes the frame's stream time so results do not depend on how fast
+        # it is processed. `draw=False` skips the overlay for headless use.
+        height, width = frame.shape[:2]
+        geometry = self._geometry(height, width)
+        scale = self.processing_scale
+        x0, y0, x1, y1 = geometry['roi']
         
+        gray = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        if scale != 1.0:
+            gray = cv2.resize(gray, geometry['size'], interpolation=cv2.INTER_AREA)
         
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        gray = cv2.GaussianBlur(gray, geometry['blur'], 0)
         
-        gray = cv2.GaussianBlur(gray, (21, 21), 0)
         
+        if self.prev_frame is not None and self.prev_frame.shape != gray.shape:
+            self.engine.reset()
+        self.prev_frame = gray
         
-        if self.prev_frame is None:
-            self.prev_frame = gray
+        thresh = self.engine.apply(gray, self.motion_threshold)
+        if thresh is None:
             return frame, {}
         
-        
-        frame_delta = cv2.absdiff(self.prev_frame, gray)
-        
-        thresh = cv2.threshold(frame_delta, self.motion_threshold, 255, cv2.THRESH_BINARY)[1]
-        
         thresh = cv2.dilate(thresh, None, iterations=2)
         
-        
-        contours, _ = cv2.findContours(thresh.copy(), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if geometry['mask'] is not None:
+            thresh = cv2.bitwise_and(thresh, geometry['mask'])
         
         
-        motion_regions = {}
-        current_time = time.time()
+        current_time = time.time() if timestamp is None else timestamp
         
         
         for region in self.active_regions:
@@ -76,44 +375,57 @@ class MotionDetector:
                 self.active_regions[region] = False
         
         
-        height, width = frame.shape[:2]
-        
-        for contour in contours:
-            if cv2.contourArea(contour) < self.min_contour_area:
-                continue
-                
-            (x, y, w, h) = cv2.boundingRect(contour)
+        names = geometry['names']
+        bounds = geometry['bounds']
+        box = geometry['box']
+        
+        # Motion energy: fraction of each region's pixels above threshold,
+        # read for all regions at once from the integral image.
+        integral = cv2.integral(thresh)
+        energy = (integral[box[:, 3], box[:, 2]] - integral[box[:, 1], box[:, 2]]
+                  - integral[box[:, 3], box[:, 0]] + integral[box[:, 1], box[:, 0]])
+        scores = energy / 255.0 / geometry['areas']
+        self.region_scores = dict(zip(names, scores.tolist()))
+        
+        contours, _ = cv2.findContours(thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        stats = _contour_stats(contours)
+        stats = stats[stats[:, 4] >= geometry['min_area']]
+        self.detection_info = {'engine': self.engine.name, 'contours': len(stats)}
+        
+        if len(stats):
+            # Map the contour boxes back to full-resolution frame coordinates.
+            x = (stats[:, 0] / scale).astype(np.int64) + x0
+            y = (stats[:, 1] / scale).astype(np.int64) + y0
+            w = np.round(stats[:, 2] / scale).astype(np.int64)
+            h = np.round(stats[:, 3] / scale).astype(np.int64)
+            center_x = (x + w // 2)[:, None]
+            center_y = (y + h // 2)[:, None]
             
-
-            for region_name, region_info in self.body_regions.items():
-                rx1, ry1, rx2, ry2 = region_info['region']
-                region_x1, region_y1 = int(rx1 * width), int(ry1 * height)
-                region_x2, region_y2 = int(rx2 * width), int(ry2 * height)
-                
-                
-                cv2.rectangle(frame, (region_x1, region_y1), (region_x2, region_y2), (0, 255, 0), 1)
-                
-                
-                contour_center_x = x + w//2
-                contour_center_y = y + h//2
-                
-                if (region_x1 <= contour_center_x <= region_x2 and 
-                    region_y1 <= contour_center_y <= region_y2):
-                    
+            inside = ((bounds[:, 0] <= center_x) & (center_x <= bounds[:, 2]) &
+                      (bounds[:, 1] <= center_y) & (center_y <= bounds[:, 3]))
+            
+            for region_name, hit in zip(names, inside.any(axis=0)):
+                if hit:
                     self.active_regions[region_name] = True
                     self.cooldown[region_name] = current_time + self.cooldown_time
-                    
-                    
-                    cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 0, 255), 2)
-        
-        
-        self.prev_frame = gray
+            
+            if not draw:
+                return frame, self.active_regions
+            for region_x1, region_y1, region_x2, region_y2 in bounds.tolist():
+                cv2.rectangle(frame, (region_x1, region_y1), (region_x2, region_y2), (0, 255, 0), 1)
+            for bx, by, bw, bh in np.stack([x, y, w, h], axis=1)[inside.any(axis=1)].tolist():
+                cv2.rectangle(frame, (bx, by), (bx + bw, by + bh), (0, 0, 255), 2)
         
         
         return frame, self.active_regions
     
     def get_active_brain_regions(self):
         
+        brain_scores = {}
+        for region_name, score in self.region_scores.items():
+            brain_area = self.body_regions[region_name]['brain_area']
+            brain_scores[brain_area] = max(brain_scores.get(brain_area, 0.0), score)
+        
         active_brain_regions = {}
         for region_name, is_active in self.active_regions.items():
             if is_active:
@@ -122,7 +434,8 @@ class MotionDetector:
                 active_brain_regions[brain_area] = {
                     'active': True,
                     'body_part': region_name,
-                    'description': description
+                    'description': description,
+                    'score': brain_scores.get(brain_area, 0.0)
                 }
         
         
@@ -132,45 +445,29 @@ class MotionDetector:
                 active_brain_regions[region] = {
                     'active': False,
                     'body_part': None,
+                    'score': brain_scores.get(region, 0.0),
                     'description': f"{'Left' if region == 'C3' else 'Right' if region == 'C4' else 'Middle'} side of brain ({region})"
                 }
                 
         return active_brain_regions
         
-    def generate_real_time_signal(self, region, base_signal, num_points=100):
-        
-        import numpy as np
-        
+    def generate_real_time_signals(self, base_signals, regions=('C3', 'Cz', 'C4'), num_points=100):
+        # One batched step for all regions; base_signals holds one row per
+        # region, in the same order as `regions`.
+        streamer = self.signal_streamer
+        if (streamer is None or streamer.num_points != num_points
+                or streamer.base.shape != np.shape(base_signals)):
+            streamer = self.signal_streamer = SignalStreamer(base_signals, num_points=num_points)
         
         active_regions = self.get_active_brain_regions()
-        is_active = active_regions[region]['active']
-        
+        return streamer.step([active_regions[region]['active'] for region in regions])
         
-        if len(base_signal) > num_points:
-            start_idx = np.random.randint(0, len(base_signal) - num_points)
-            signal_segment = base_signal[start_idx:start_idx + num_points].copy()
-        else:
-            
-            signal_segment = base_signal.copy()
-            
+    def generate_real_time_signal(self, region, base_signal, num_points=100):
         
-        if is_active:
-            
-            amplitude_factor = 1.5 + 0.5 * np.random.random()
-            signal_segment = signal_segment * amplitude_factor
-            
-            
-            t = np.linspace(0, 2*np.pi, len(signal_segment))
-            high_freq = 0.3 * np.sin(10*t) + 0.2 * np.sin(15*t)
-            signal_segment += high_freq[:len(signal_segment)]
-        else:
-            
-            amplitude_factor = 0.7 + 0.3 * np.random.random()
-            signal_segment = signal_segment * amplitude_factor
-            
-            
-            t = np.linspace(0, 2*np.pi, len(signal_segment))
-            low_freq = 0.2 * np.sin(2*t)
-            signal_segment += low_freq[:len(signal_segment)]
+        streamer = self.region_streamers.get(region)
+        if (streamer is None or streamer.num_points != num_points
+                or streamer.base.shape[1] != len(base_signal)):
+            streamer = self.region_streamers[region] = SignalStreamer(base_signal, num_points=num_points)
         
-        return signal_segment
\ No newline at end of file
+        is_active = self.get_active_brain_regions()[region]['active']
+        return streamer.step([is_active])[0].copy()
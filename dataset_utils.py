@@ -0,0 +1,467 @@
+import argparse
+import json
+import mmap
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def _is_mapped(array):
+    base = array
+    while isinstance(base, np.ndarray):
+        base = base.base
+    return isinstance(base, mmap.mmap)
+
+
+def _nbytes(value):
+    # Memory-mapped arrays live in the page cache, not in our budget.
+    if isinstance(value, np.ndarray):
+        return 0 if _is_mapped(value) else value.nbytes
+    if isinstance(value, dict):
+        return sum(_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sum(_nbytes(v) for v in value)
+    return getattr(value, 'nbytes', 0)
+
+
+def _freeze(value):
+    if isinstance(value, np.ndarray):
+        value.setflags(write=False)
+    elif isinstance(value, dict):
+        for v in value.values():
+            _freeze(v)
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            _freeze(v)
+    return value
+
+
+# Entries are grouped per subject file and keyed by (path, mtime), so replacing
+# a file invalidates everything derived from it. Whole subjects are evicted in
+# LRU order once the total size goes over max_bytes.
+class DatasetCache:
+
+    def __init__(self, max_bytes=512 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._subjects = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def subject_key(path):
+        path = os.path.abspath(path)
+        return path, os.stat(path).st_mtime_ns
+
+    def get(self, path, name, loader):
+        key = self.subject_key(path)
+        with self._lock:
+            entries = self._subjects.get(key)
+            if entries is not None and name in entries:
+                self.hits += 1
+                self._subjects.move_to_end(key)
+                return entries[name]
+            self.misses += 1
+
+        # Load outside the lock so other subjects stay readable meanwhile.
+        value = _freeze(loader())
+
+        with self._lock:
+            self._drop_stale(key)
+            entries = self._subjects.setdefault(key, {})
+            if name in entries:
+                return entries[name]
+            entries[name] = value
+            self._sizes[key] = self._sizes.get(key, 0) + _nbytes(value)
+            self._subjects.move_to_end(key)
+            self._evict(keep=key)
+        return value
+
+    def _drop_stale(self, key):
+        for other in [k for k in self._subjects if k[0] == key[0] and k != key]:
+            del self._subjects[other]
+            del self._sizes[other]
+
+    def _evict(self, keep):
+        # The subject being served is never evicted, even if it alone exceeds
+        # the budget, otherwise every rerun would reload it.
+        while self.total_bytes > self.max_bytes and len(self._subjects) > 1:
+            oldest = next(iter(self._subjects))
+            if oldest == keep:
+                break
+            del self._subjects[oldest]
+            del self._sizes[oldest]
+            self.evictions += 1
+
+    @property
+    def total_bytes(self):
+        return sum(self._sizes.values())
+
+    def set_budget(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            if self._subjects:
+                self._evict(keep=next(reversed(self._subjects)))
+
+    def clear(self):
+        with self._lock:
+            self._subjects.clear()
+            self._sizes.clear()
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'subjects': len(self._subjects),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+            }
+
+
+MI_TYPES = {769: 'left', 770: 'right', 771: 'foot', 772: 'tongue', 783: 'unknown'}
+# Channels 0-21 are EEG, the remaining three are EOG.
+EEG_CHANNELS = 22
+
+dataset_cache = DatasetCache(
+    max_bytes=int(os.environ.get('SYNCWAVE_CACHE_MB', 512)) * 1024 * 1024
+)
+
+
+MAPPED_SUFFIX = '.mmap'
+CHUNK_SAMPLES = 4096
+
+
+def _load_arrays(dataset):
+    if dataset.endswith(MAPPED_SUFFIX):
+        return _load_mapped(dataset)
+    with np.load(dataset) as data:
+        return {
+            'raw': data['s'].T,
+            'events_type': data['etyp'].T,
+            'events_position': data['epos'].T,
+            'events_duration': data['edur'].T,
+            'artifacts': data['artifacts'].T,
+        }
+
+
+# Memory-mapped layout, one directory per subject:
+#   meta.json   shape, dtype, chunk size and the stat of the source .npz
+#   events.npz  etyp/epos/edur/artifacts as stored in the source (tiny)
+#   signal.bin  channel-major samples; every channel row is padded to a whole
+#               number of CHUNK_SAMPLES chunks, so rows start page-aligned and
+#               reading one channel or one trial touches only those pages.
+def convert_to_mapped(source, target=None, chunk_samples=CHUNK_SAMPLES, dtype=None):
+    target = target or os.path.splitext(source)[0] + MAPPED_SUFFIX
+    stat = os.stat(source)
+    with np.load(source) as data:
+        signal = data['s']
+        events = {k: data[k] for k in ('etyp', 'epos', 'edur', 'artifacts')}
+
+    dtype = signal.dtype if dtype is None else np.dtype(dtype)
+    n_samples, n_channels = signal.shape
+    row = -(-n_samples // chunk_samples) * chunk_samples
+
+    tmp = f"{target}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    out = np.memmap(os.path.join(tmp, 'signal.bin'), mode='w+', dtype=dtype, shape=(n_channels, row))
+    # Transpose one chunk at a time so the channel-major copy never needs a
+    # second full-size buffer.
+    for start in range(0, n_samples, chunk_samples):
+        stop = min(start + chunk_samples, n_samples)
+        out[:, start:stop] = signal[start:stop].T
+    out.flush()
+    del out
+
+    np.savez(os.path.join(tmp, 'events.npz'), **events)
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump({
+            'n_channels': n_channels,
+            'n_samples': n_samples,
+            'row_samples': row,
+            'dtype': dtype.str,
+            'chunk_samples': chunk_samples,
+            'source_size': stat.st_size,
+            'source_mtime_ns': stat.st_mtime_ns,
+        }, f)
+
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    return target
+
+
+def _map_signal(path, meta):
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if hasattr(mmap, 'MADV_RANDOM'):
+        # Trials are scattered reads; kernel readahead would pull in
+        # neighbouring chunks we are not going to use.
+        mapped.madvise(mmap.MADV_RANDOM)
+    shape = (meta['n_channels'], meta['row_samples'])
+    signal = np.ndarray(shape, dtype=np.dtype(meta['dtype']), buffer=mapped)
+    return signal[:, :meta['n_samples']]
+
+
+def _load_mapped(path):
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    with np.load(os.path.join(path, 'events.npz')) as events:
+        return {
+            'raw': _map_signal(os.path.join(path, 'signal.bin'), meta),
+            'events_type': events['etyp'].T,
+            'events_position': events['epos'].T,
+            'events_duration': events['edur'].T,
+            'artifacts': events['artifacts'].T,
+        }
+
+
+def _first_between(events, starts, bounds):
+    # Index of the first of `events` in [starts[k], bounds[k]) for every k,
+    # or -1 where there is none.
+    first = np.searchsorted(events, starts)
+    found = first < len(events)
+    result = np.full(len(starts), -1, dtype=np.int64)
+    result[found] = np.where(events[first[found]] < bounds[found], events[first[found]], -1)
+    return result
+
+
+def resolve_dataset(dataset):
+    # 'A01T', 'A01T.npz' and 'A01T.mmap' all name the same subject. A mapped
+    # copy is preferred whenever it was converted from the current .npz.
+    if dataset.endswith(MAPPED_SUFFIX):
+        return dataset
+    if not dataset.endswith('.npz'):
+        dataset += '.npz'
+    mapped = dataset[:-len('.npz')] + MAPPED_SUFFIX
+    try:
+        with open(os.path.join(mapped, 'meta.json')) as f:
+            meta = json.load(f)
+        stat = os.stat(dataset)
+    except OSError:
+        return mapped if not os.path.exists(dataset) and os.path.isdir(mapped) else dataset
+    if (meta['source_size'], meta['source_mtime_ns']) == (stat.st_size, stat.st_mtime_ns):
+        return mapped
+    return dataset
+
+
+def dataset_version(path):
+    # (size, mtime_ns) of the recording behind a resolved dataset path. A
+    # mapped copy reports the .npz it was converted from, so results derived
+    # from a subject stay valid when it is converted.
+    if path.endswith(MAPPED_SUFFIX):
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        return meta['source_size'], meta['source_mtime_ns']
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+class MotorImageryDataset:
+    def __init__(self, dataset='A01T.npz', cache=None):
+        dataset = resolve_dataset(dataset)
+
+        self.path = dataset
+        self.cache = dataset_cache if cache is None else cache
+        self.data = self.cache.get(dataset, 'arrays', lambda: _load_arrays(dataset))
+        self.Fs = 250
+        self.raw = self.data['raw']
+        self.events_type = self.data['events_type']
+        self.events_position = self.data['events_position']
+        self.events_duration = self.data['events_duration']
+        self.artifacts = self.data['artifacts']
+
+        self.mi_types = dict(MI_TYPES)
+
+    def get_trial_index(self):
+        return self.cache.get(self.path, 'trial_index', self._build_trial_index)
+
+    def _build_trial_index(self):
+        # One entry per trial start (768), labelled with the first class event
+        # that follows it and flagged as an artifact when the expert scoring
+        # marks it or a rejection event (1023) sits inside it. Trials without
+        # a known class or running past the end of the recording are left out.
+        startrial_code = 768
+        rejected_code = 1023
+        types = self.events_type[0]
+
+        starts = np.flatnonzero(types == startrial_code)
+        # The events belonging to trial k lie between its start and the next
+        # one; a searchsorted per event kind finds them for all trials at once.
+        bounds = np.append(starts[1:], len(types))
+        cue = _first_between(np.flatnonzero(np.isin(types, list(self.mi_types))), starts, bounds)
+        rejected = _first_between(np.flatnonzero(types == rejected_code), starts, bounds) >= 0
+
+        # One expert artifact flag per trial start, in recording order.
+        flags = np.zeros(len(starts), dtype=bool)
+        scored = np.asarray(self.artifacts).ravel()[:len(starts)].astype(bool)
+        flags[:len(scored)] = scored
+
+        trial = np.flatnonzero(cue >= 0)
+        start = self.events_position[0, starts[trial]].astype(np.int64)
+        duration = self.events_duration[0, starts[trial]].astype(np.int64)
+        inside = start + duration <= self.raw.shape[1]
+        trial = trial[inside]
+
+        return {
+            'trial': trial,
+            'event': starts[trial],
+            'start': start[inside],
+            'duration': duration[inside],
+            'cue': self.events_position[0, cue[trial]].astype(np.int64),
+            'label': types[cue[trial]].astype(np.int64),
+            'artifact': flags[trial] | rejected[trial],
+        }
+
+    def select_trials(self, label=None, clean=True):
+        # Positions into the trial index. `label` is a class code, a class
+        # name ('right'), a list of either, or None for every class; `clean`
+        # drops artifact trials, so select_trials('right') are the clean
+        # right-hand trials.
+        index = self.get_trial_index()
+        mask = np.ones(len(index['start']), dtype=bool)
+        if clean:
+            mask &= ~index['artifact']
+        if label is not None:
+            labels = [label] if isinstance(label, (str, int, np.integer)) else label
+            names = {name: code for code, name in self.mi_types.items()}
+            codes = [names[l] if isinstance(l, str) else int(l) for l in labels]
+            mask &= np.isin(index['label'], codes)
+        return np.flatnonzero(mask)
+
+    def get_eog_corrected(self):
+        # The recording with eye artifacts regressed out: the 22 EEG channels
+        # minus their least-squares projection on the 3 EOG channels, and the
+        # EOG channels unchanged. Computed once and cached; the fitted (3, 22)
+        # coefficients are in `eog_coefficients`.
+        corrected = self.cache.get(self.path, 'eog_corrected', self._remove_eog)
+        return corrected['raw']
+
+    @property
+    def eog_coefficients(self):
+        return self.cache.get(self.path, 'eog_corrected', self._remove_eog)['coefficients']
+
+    def _remove_eog(self, chunk_samples=CHUNK_SAMPLES * 16):
+        eeg, eog = slice(0, EEG_CHANNELS), slice(EEG_CHANNELS, self.raw.shape[0])
+        n_eog = self.raw.shape[0] - EEG_CHANNELS
+        n_samples = self.raw.shape[1]
+
+        # Accumulate the sums for the centred normal equations chunk by chunk,
+        # so a memory-mapped recording is streamed once and the samples with
+        # NaNs (gaps between runs) are skipped without a full-size copy.
+        count = 0
+        sums = np.zeros(self.raw.shape[0])
+        gram = np.zeros((n_eog, n_eog))
+        cross = np.zeros((n_eog, EEG_CHANNELS))
+        for start in range(0, n_samples, chunk_samples):
+            block = np.asarray(self.raw[:, start:start + chunk_samples], dtype=np.float64)
+            block = block[:, ~np.isnan(block).any(axis=0)]
+            count += block.shape[1]
+            sums += block.sum(axis=1)
+            gram += block[eog] @ block[eog].T
+            cross += block[eog] @ block[eeg].T
+
+        mean = sums / max(count, 1)
+        gram -= count * np.outer(mean[eog], mean[eog])
+        cross -= count * np.outer(mean[eog], mean[eeg])
+        coefficients = np.linalg.lstsq(gram, cross, rcond=None)[0]
+
+        corrected = np.empty(self.raw.shape, dtype=self.raw.dtype)
+        for start in range(0, n_samples, chunk_samples):
+            block = np.asarray(self.raw[:, start:start + chunk_samples])
+            stop = start + block.shape[1]
+            corrected[eeg, start:stop] = block[eeg] - coefficients.T @ (block[eog] - mean[eog, None])
+            corrected[eog, start:stop] = block[eog]
+        return {'raw': corrected, 'coefficients': coefficients}
+
+    def get_epochs(self, channels=None, dtype=None, clean=True, eog=False):
+        # A (trials, channels, samples) tensor and the class codes. `channels`
+        # is a list of indices, a slice or None for all 25 channels (22 EEG +
+        # 3 EOG). Every trial is cut to the shortest trial duration so the
+        # result is rectangular. `clean` leaves out artifact trials and `eog`
+        # cuts the trials from get_eog_corrected(). The tensor is cached and
+        # read-only; dtype=np.float32 halves its memory.
+        if channels is None:
+            channels = slice(None)
+        if isinstance(channels, slice):
+            channels = range(self.raw.shape[0])[channels]
+        channels = tuple(int(c) for c in channels)
+        dtype = self.raw.dtype if dtype is None else np.dtype(dtype)
+
+        index = self.get_trial_index()
+        selected = self.select_trials(clean=clean)
+        epochs = self.cache.get(
+            self.path, ('epochs', channels, dtype.str, clean, eog),
+            lambda: self._extract_epochs(
+                self.get_eog_corrected() if eog else self.raw,
+                index['start'][selected], index['duration'][selected], channels, dtype
+            )
+        )
+        return epochs, index['label'][selected]
+
+    def _extract_epochs(self, source, starts, durations, channels, dtype):
+        samples = int(durations.min()) if len(starts) else 0
+        # windows[c, t] is a view of source[c, t:t + samples]; gathering from
+        # it cuts every trial of every channel in a single indexing operation.
+        windows = np.lib.stride_tricks.sliding_window_view(source, samples, axis=1)
+        channels = np.asarray(channels, dtype=np.intp)
+
+        if dtype == source.dtype:
+            return windows[channels[None, :], starts[:, None]]
+
+        # Cast channel by channel so a float32 request never materialises the
+        # full float64 tensor.
+        epochs = np.empty((len(starts), len(channels), samples), dtype=dtype)
+        for k, c in enumerate(channels):
+            epochs[:, k] = windows[c, starts]
+        return epochs
+
+    def get_trials_from_channel(self, channel=7, clean=True, eog=False):
+        epochs, labels = self.get_epochs([channel], clean=clean, eog=eog)
+        trials = list(epochs[:, 0:1])
+        classes = [self.mi_types[code] for code in labels]
+
+        return trials, classes
+
+    def get_trials_from_channels(self, channels=[7, 9, 11], clean=True, eog=False):
+        epochs, labels = self.get_epochs(channels, clean=clean, eog=eog)
+        classes = [self.mi_types[code] for code in labels]
+
+        trials_c = [epochs[:, k] for k in range(len(channels))]
+        classes_c = [list(classes) for _ in channels]
+
+        return trials_c, classes_c
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert subject recordings to the memory-mapped layout.")
+    parser.add_argument('subjects', nargs='*', default=[f"A0{i}{s}" for s in 'TE' for i in range(1, 10)])
+    parser.add_argument('--data-dir', default='.')
+    parser.add_argument('--chunk', type=int, default=CHUNK_SAMPLES, help="Samples per chunk")
+    parser.add_argument('--float32', action='store_true', help="Store samples as float32")
+    args = parser.parse_args()
+
+    for subject in args.subjects:
+        source = os.path.join(args.data_dir, subject if subject.endswith('.npz') else f"{subject}.npz")
+        if not os.path.exists(source):
+            print(f"{source}: missing, skipped")
+            continue
+        target = convert_to_mapped(source, chunk_samples=args.chunk,
+                                   dtype=np.float32 if args.float32 else None)
+        print(f"{source} -> {target}")
+
+
+if __name__ == '__main__':
+    main()
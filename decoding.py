@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+from scipy import linalg, signal
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
+from sklearn.model_selection import StratifiedKFold, cross_validate
+from sklearn.pipeline import make_pipeline
+
+from dataset_utils import MotorImageryDataset
+from features import EEG_CHANNELS, SUBJECTS, cache_path
+
+MI_CLASSES = (769, 770, 771, 772)
+
+
+def bandpass_sos(fs, band=(8, 30), order=4):
+    return signal.butter(order, band, btype='bandpass', fs=fs, output='sos')
+
+
+def bandpass(epochs, fs, band=(8, 30), order=4):
+    # Zero-phase filtering of every trial and channel in one call.
+    return signal.sosfiltfilt(bandpass_sos(fs, band, order), np.nan_to_num(epochs), axis=-1)
+
+
+def covariances(epochs):
+    # Trace-normalised spatial covariance of every trial: (trials, ch, ch).
+    covs = np.einsum('tcs,tds->tcd', epochs, epochs)
+    return covs / np.trace(covs, axis1=1, axis2=2)[:, None, None]
+
+
+class CSP(BaseEstimator, TransformerMixin):
+    # Common Spatial Patterns, one-vs-rest for more than two classes. Each
+    # class contributes n_components filters, taken from both ends of the
+    # generalised eigenvalue spectrum; features are log-variances.
+    def __init__(self, n_components=4):
+        self.n_components = n_components
+
+    def fit(self, X, y):
+        covs = covariances(X)
+        self.classes_ = np.unique(y)
+        pairs = [self.classes_[:1]] if len(self.classes_) == 2 else [[c] for c in self.classes_]
+
+        filters = []
+        for members in pairs:
+            mask = np.isin(y, members)
+            cov_a, cov_b = covs[mask].mean(axis=0), covs[~mask].mean(axis=0)
+            _, vectors = linalg.eigh(cov_a, cov_a + cov_b)
+            half = self.n_components // 2
+            picks = np.r_[np.arange(half), np.arange(-(self.n_components - half), 0)]
+            filters.append(vectors[:, picks].T)
+
+        self.filters_ = np.concatenate(filters)
+        return self
+
+    def transform(self, X):
+        projected = np.einsum('fc,tcs->tfs', self.filters_, X)
+        variances = projected.var(axis=-1)
+        return np.log(variances / variances.sum(axis=1, keepdims=True))
+
+
+def make_decoder(n_components=4):
+    return make_pipeline(CSP(n_components=n_components), LinearDiscriminantAnalysis())
+
+
+def load_decoding_data(dataset, band=(8, 30), tmin=2.5, tmax=6.0, channels=EEG_CHANNELS, clean=True, eog=False):
+    # Filter whole trials before cropping so the filter transients fall
+    # outside the motor-imagery window.
+    if isinstance(dataset, str):
+        dataset = MotorImageryDataset(dataset)
+
+    epochs, labels = dataset.get_epochs(channels, dtype=np.float32, clean=clean, eog=eog)
+    keep = np.isin(labels, MI_CLASSES)
+    filtered = bandpass(epochs[keep], dataset.Fs, band)
+    start, stop = int(tmin * dataset.Fs), int(tmax * dataset.Fs)
+    return filtered[..., start:stop], labels[keep]
+
+
+def cross_validate_subject(dataset_path, n_splits=5, n_components=4, band=(8, 30),
+                           tmin=2.5, tmax=6.0, n_jobs=None, seed=0, clean=True, eog=False):
+    X, y = load_decoding_data(dataset_path, band, tmin, tmax, clean=clean, eog=eog)
+    cv = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=seed)
+    scores = cross_validate(make_decoder(n_components), X, y, cv=cv, n_jobs=n_jobs)
+
+    fold_size = len(y) / n_splits
+    return {
+        'subject': os.path.splitext(os.path.basename(dataset_path))[0],
+        'trials': int(len(y)),
+        'accuracy': float(scores['test_score'].mean()),
+        'accuracy_std': float(scores['test_score'].std()),
+        'fold_accuracy': scores['test_score'].tolist(),
+        'fit_ms': float(scores['fit_time'].mean() * 1000),
+        'predict_ms_per_trial': float(scores['score_time'].mean() * 1000 / fold_size),
+        'chance': float(np.bincount(np.unique(y, return_inverse=True)[1]).max() / len(y)),
+    }
+
+
+def fit_subject(dataset_path, n_components=4, band=(8, 30), tmin=2.5, tmax=6.0, clean=True, eog=False):
+    X, y = load_decoding_data(dataset_path, band, tmin, tmax, clean=clean, eog=eog)
+    return make_decoder(n_components).fit(X, y)
+
+
+def _evaluate_to_file(dataset_path, params, path, model_path):
+    result = cross_validate_subject(dataset_path, **params)
+    # Keep a model fitted on every trial so the app and the online decoder
+    # never have to retrain.
+    fit_params = {k: params[k] for k in ('n_components', 'band', 'tmin', 'tmax', 'clean', 'eog')}
+    # Concurrent sessions may evaluate the same subject, so every writer
+    # gets its own temp files. The model lands first: a result on disk means
+    # its model is there too.
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(model_path) or '.', suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        joblib.dump(fit_subject(dataset_path, **fit_params), f)
+    os.replace(tmp, model_path)
+
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(result, f)
+    os.replace(tmp, path)
+    return result
+
+
+class DecodingStore:
+    # Cross-validation results (.json) and a full-data model (.joblib) per
+    # subject and parameter set.
+    def __init__(self, cache_dir='.decoding_cache', data_dir='.'):
+        self.cache_dir = cache_dir
+        self.data_dir = data_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def dataset_path(self, subject):
+        return os.path.join(self.data_dir, subject if subject.endswith('.npz') else f"{subject}.npz")
+
+    @staticmethod
+    def _params(n_splits=5, n_components=4, band=(8, 30), tmin=2.5, tmax=6.0, seed=0, clean=True, eog=False):
+        return {'n_splits': n_splits, 'n_components': n_components, 'band': tuple(band),
+                'tmin': tmin, 'tmax': tmax, 'seed': seed, 'clean': clean, 'eog': eog}
+
+    def paths(self, subject, **params):
+        path = cache_path(self.cache_dir, self.dataset_path(subject), self._params(**params), '.json')
+        return path, path[:-len('.json')] + '.joblib'
+
+    def cached(self, subject, **params):
+        path, _ = self.paths(subject, **params)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def get(self, subject, n_jobs=None, **params):
+        result = self.cached(subject, **params)
+        if result is None:
+            path, model_path = self.paths(subject, **params)
+            result = _evaluate_to_file(self.dataset_path(subject), dict(self._params(**params), n_jobs=n_jobs),
+                                       path, model_path)
+        return result
+
+    def model(self, subject, **params):
+        self.get(subject, **params)
+        return joblib.load(self.paths(subject, **params)[1])
+
+    def evaluate_all(self, subjects=SUBJECTS, workers=None, **params):
+        results = {subject: self.cached(subject, **params) for subject in subjects}
+        missing = [s for s, r in results.items() if r is None]
+
+        if missing:
+            # Subjects run in parallel; folds within a subject stay serial so
+            # the pool is not oversubscribed.
+            task_params = dict(self._params(**params), n_jobs=1)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {s: pool.submit(_evaluate_to_file, self.dataset_path(s), task_params,
+                                          *self.paths(s, **params))
+                           for s in missing}
+                for subject, future in futures.items():
+                    results[subject] = future.result()
+
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-validate CSP + LDA motor-imagery decoding.")
+    parser.add_argument('subjects', nargs='*', default=SUBJECTS)
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--components', type=int, default=4)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--data-dir', default='.')
+    parser.add_argument('--cache-dir', default='.decoding_cache')
+    args = parser.parse_args()
+
+    store = DecodingStore(cache_dir=args.cache_dir, data_dir=args.data_dir)
+    start = time.perf_counter()
+    results = store.evaluate_all(args.subjects, workers=args.workers,
+                                 n_splits=args.folds, n_components=args.components)
+    elapsed = time.perf_counter() - start
+
+    print(f"{'subject':<8} {'trials':>6} {'accuracy':>9} {'chance':>7} {'fit ms':>8} {'predict ms/trial':>17}")
+    for r in results.values():
+        print(f"{r['subject']:<8} {r['trials']:>6} {r['accuracy']:>6.3f}±{r['accuracy_std']:.2f} "
+              f"{r['chance']:>6.3f} {r['fit_ms']:>8.1f} {r['predict_ms_per_trial']:>17.3f}")
+    print(f"{len(results)} subjects in {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    # Go through the importable module so pickled models reference
+    # decoding.CSP rather than __main__.CSP.
+    import decoding
+    decoding.main()
@@ -0,0 +1,272 @@
+import argparse
+import asyncio
+import struct
+import time
+
+import numpy as np
+
+from dataset_utils import MotorImageryDataset
+
+# Every message starts with the same little-endian header:
+#   magic, kind, sample position, stream time (s), server wall clock (s), a, b
+# SAMPLES: a = n_channels, b = n_samples, followed by n_samples * n_channels
+#          float32 values in sample-major order.
+# MARKER:  a = event type (etyp), b = event duration (edur), no payload.
+# END:     no payload; the server closes the connection afterwards.
+HEADER = struct.Struct('<4sB3xQddII')
+MAGIC = b'EEG1'
+SAMPLES, MARKER, END = 1, 2, 3
+
+
+class EEGReplayServer:
+    # Replays a subject's recording to any number of TCP subscribers. One
+    # producer paces the stream (speed=1 is real time, speed=0 is as fast as
+    # possible) and hands the same header bytes and a memoryview of the
+    # float32 recording to every subscriber, so payloads are never copied per
+    # client. Each subscriber has a bounded queue; when a slow client falls
+    # behind, its oldest messages are dropped instead of stalling the others.
+    def __init__(self, dataset, host='127.0.0.1', port=0, speed=1.0, block_size=25,
+                 queue_size=256, min_subscribers=0, loop=False, duration=None):
+        if isinstance(dataset, str):
+            dataset = MotorImageryDataset(dataset)
+        self.fs = dataset.Fs
+        # dataset.raw is a channel-major view of the time-major 's' matrix, so
+        # its transpose is contiguous and every block is one contiguous slice.
+        stop = None if duration is None else int(duration * self.fs)
+        self.samples = np.ascontiguousarray(dataset.raw.T[:stop], dtype='<f4')
+        self.events = np.stack([dataset.events_position[0], dataset.events_type[0],
+                                dataset.events_duration[0]], axis=1).astype(np.int64)
+        self.events = self.events[np.argsort(self.events[:, 0], kind='stable')]
+
+        self.host = host
+        self.port = port
+        self.speed = speed
+        self.block_size = block_size
+        self.queue_size = queue_size
+        self.min_subscribers = min_subscribers
+        self.loop = loop
+
+        self.subscribers = {}
+        self.dropped = 0
+        self.blocks_sent = 0
+        self.server = None
+        self._producer = None
+        self._ready = None
+
+    async def start(self):
+        self._ready = asyncio.Event()
+        if self.min_subscribers == 0:
+            self._ready.set()
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        self._producer = asyncio.create_task(self._produce())
+        return self
+
+    async def wait_closed(self):
+        await self._producer
+
+    async def stop(self):
+        if self._producer is not None:
+            self._producer.cancel()
+            try:
+                await self._producer
+            except asyncio.CancelledError:
+                pass
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        queue = asyncio.Queue(self.queue_size)
+        self.subscribers[writer] = queue
+        if len(self.subscribers) >= self.min_subscribers:
+            self._ready.set()
+        try:
+            while True:
+                parts = await queue.get()
+                writer.writelines(parts)
+                await writer.drain()
+                if parts[0][4] == END:
+                    break
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.subscribers.pop(writer, None)
+            writer.close()
+
+    def _publish(self, parts):
+        for queue in self.subscribers.values():
+            if queue.full():
+                queue.get_nowait()
+                self.dropped += 1
+            queue.put_nowait(parts)
+
+    async def _produce(self):
+        await self._ready.wait()
+        n_samples, n_channels = self.samples.shape
+        payload = memoryview(self.samples).cast('B')
+        row_bytes = n_channels * self.samples.itemsize
+
+        while True:
+            start = time.perf_counter()
+            event = 0
+            for position in range(0, n_samples, self.block_size):
+                stop = min(position + self.block_size, n_samples)
+                stream_time = position / self.fs
+                if self.speed:
+                    delay = start + stream_time / self.speed - time.perf_counter()
+                    await asyncio.sleep(max(0.0, delay))
+                else:
+                    await asyncio.sleep(0)
+
+                now = time.time()
+                while event < len(self.events) and self.events[event, 0] < stop:
+                    epos, etyp, edur = self.events[event].tolist()
+                    self._publish((HEADER.pack(MAGIC, MARKER, epos, epos / self.fs, now, etyp, edur),))
+                    event += 1
+
+                header = HEADER.pack(MAGIC, SAMPLES, position, stream_time, now, n_channels, stop - position)
+                self._publish((header, payload[position * row_bytes:stop * row_bytes]))
+                self.blocks_sent += 1
+
+            if not self.loop:
+                break
+
+        self._publish((HEADER.pack(MAGIC, END, n_samples, n_samples / self.fs, time.time(), 0, 0),))
+
+
+class EEGStreamProtocol(asyncio.BufferedProtocol):
+    # Client side. The event loop reads straight into a preallocated
+    # bytearray and samples are handed to `on_block` as a numpy view of that
+    # buffer, shaped (n_channels, n_samples), without any copy. The view is
+    # only valid during the callback; copy it to keep it.
+    def __init__(self, on_block=None, on_marker=None, buffer_size=1 << 20):
+        self.on_block = on_block
+        self.on_marker = on_marker
+        self.buffer = bytearray(buffer_size)
+        self.start = 0
+        self.end = 0
+        self.blocks = 0
+        self.samples = 0
+        self.markers = 0
+        self.bytes = 0
+        self.latencies = []
+        self.done = asyncio.get_running_loop().create_future()
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def get_buffer(self, sizehint):
+        if self.end == len(self.buffer):
+            self._compact(len(self.buffer) * 2 if self.start == 0 else len(self.buffer))
+        return memoryview(self.buffer)[self.end:]
+
+    def _compact(self, size):
+        pending = self.end - self.start
+        if size != len(self.buffer):
+            grown = bytearray(size)
+            grown[:pending] = self.buffer[self.start:self.end]
+            self.buffer = grown
+        else:
+            self.buffer[:pending] = self.buffer[self.start:self.end]
+        self.start, self.end = 0, pending
+
+    def buffer_updated(self, nbytes):
+        self.end += nbytes
+        self.bytes += nbytes
+        received = time.time()
+
+        while self.end - self.start >= HEADER.size:
+            magic, kind, position, stream_time, sent, a, b = HEADER.unpack_from(self.buffer, self.start)
+            if magic != MAGIC:
+                self.transport.close()
+                raise ValueError("Corrupt EEG stream")
+
+            body = a * b * 4 if kind == SAMPLES else 0
+            if self.end - self.start < HEADER.size + body:
+                break
+            offset = self.start + HEADER.size
+            self.start = offset + body
+
+            if kind == SAMPLES:
+                self.blocks += 1
+                self.samples += b
+                self.latencies.append(received - sent)
+                if self.on_block is not None:
+                    block = np.frombuffer(self.buffer, dtype='<f4', count=a * b, offset=offset)
+                    self.on_block(position, stream_time, block.reshape(b, a).T)
+            elif kind == MARKER:
+                self.markers += 1
+                if self.on_marker is not None:
+                    self.on_marker(position, stream_time, a, b)
+            elif kind == END:
+                self.transport.close()
+
+        if self.start == self.end:
+            self.start = self.end = 0
+
+    def connection_lost(self, exc):
+        if not self.done.done():
+            self.done.set_result(exc)
+
+
+async def subscribe(host, port, on_block=None, on_marker=None):
+    loop = asyncio.get_running_loop()
+    _, protocol = await loop.create_connection(
+        lambda: EEGStreamProtocol(on_block, on_marker), host, port
+    )
+    return protocol
+
+
+async def _bench(args):
+    server = await EEGReplayServer(args.subject, speed=args.speed, block_size=args.block,
+                                   min_subscribers=args.clients, duration=args.seconds).start()
+
+    start = time.perf_counter()
+    clients = [await subscribe(server.host, server.port) for _ in range(args.clients)]
+    await asyncio.gather(*(client.done for client in clients))
+    elapsed = time.perf_counter() - start
+    await server.stop()
+
+    duration = len(server.samples) / server.fs
+    latencies = np.concatenate([client.latencies for client in clients]) * 1000
+    samples = sum(client.samples for client in clients)
+    print(f"{args.clients} clients x {duration:.0f}s of signal in {elapsed:.2f}s "
+          f"({duration / elapsed:.1f}x real time per client)")
+    print(f"aggregate {samples / elapsed:,.0f} samples/s, "
+          f"{sum(c.bytes for c in clients) / elapsed / 2**20:.1f} MiB/s, {server.dropped} dropped messages")
+    print(f"delivery latency p50={np.percentile(latencies, 50):.2f}ms "
+          f"p99={np.percentile(latencies, 99):.2f}ms max={latencies.max():.2f}ms")
+
+
+async def _serve(args):
+    server = await EEGReplayServer(args.subject, host=args.host, port=args.port, speed=args.speed,
+                                   block_size=args.block, loop=True).start()
+    print(f"Streaming {args.subject} on {server.host}:{server.port} at {args.speed or 'max'}x")
+    await server.wait_closed()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay EEG recordings over a local socket.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    serve = sub.add_parser('serve', help="Stream a subject in a loop")
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8765)
+
+    bench = sub.add_parser('bench', help="Load-test N local subscribers")
+    bench.add_argument('--clients', type=int, default=10)
+    bench.add_argument('--seconds', type=float, default=60)
+
+    for p in (serve, bench):
+        p.add_argument('--subject', default='A01T')
+        p.add_argument('--speed', type=float, default=1.0, help="Replay speed, 0 for as fast as possible")
+        p.add_argument('--block', type=int, default=25)
+
+    args = parser.parse_args()
+    asyncio.run(_serve(args) if args.command == 'serve' else _bench(args))
+
+
+if __name__ == '__main__':
+    main()
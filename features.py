@@ -0,0 +1,152 @@
+import argparse
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import signal
+from scipy.integrate import trapezoid
+
+from dataset_utils import MI_TYPES, MotorImageryDataset, dataset_version, resolve_dataset
+
+SUBJECTS = [f"A0{i}T" for i in range(1, 10)]
+BANDS = {'mu': (8, 12), 'beta': (13, 30)}
+EEG_CHANNELS = tuple(range(22))
+
+
+def band_power(epochs, fs, bands=BANDS, method='welch'):
+    # Power of every band for every epoch along the last axis, in one call per
+    # method: (..., samples) -> (..., len(bands)).
+    epochs = np.nan_to_num(epochs)
+    if method == 'welch':
+        freqs, psd = signal.welch(epochs, fs=fs, nperseg=min(fs, epochs.shape[-1]), axis=-1)
+        powers = []
+        for low, high in bands.values():
+            band = (freqs >= low) & (freqs <= high)
+            powers.append(trapezoid(psd[..., band], freqs[band], axis=-1))
+    elif method == 'filterbank':
+        powers = []
+        for low, high in bands.values():
+            sos = signal.butter(4, (low, high), btype='bandpass', fs=fs, output='sos')
+            filtered = signal.sosfiltfilt(sos, epochs, axis=-1)
+            powers.append(np.mean(filtered ** 2, axis=-1))
+    else:
+        raise ValueError(f"Unknown band power method: {method}")
+    return np.stack(powers, axis=-1).astype(np.float32)
+
+
+def extract_features(dataset, method='welch', bands=BANDS, channels=EEG_CHANNELS, tmin=3.0, tmax=6.0,
+                     clean=True, eog=False):
+    if isinstance(dataset, str):
+        dataset = MotorImageryDataset(dataset)
+
+    epochs, labels = dataset.get_epochs(channels, dtype=np.float32, clean=clean, eog=eog)
+    start, stop = int(tmin * dataset.Fs), int(tmax * dataset.Fs)
+    return {
+        'powers': band_power(epochs[..., start:stop], dataset.Fs, bands, method),
+        'labels': labels,
+        'channels': np.asarray(channels),
+        'bands': np.asarray(list(bands)),
+    }
+
+
+def class_means(features, mi_types=MI_TYPES):
+    return {
+        mi_types[code]: features['powers'][features['labels'] == code].mean(axis=0)
+        for code in np.unique(features['labels'])
+    }
+
+
+def cache_path(cache_dir, dataset_path, params, suffix='.npz'):
+    # Derived results are keyed by their parameters and the recording's size
+    # and mtime, so a replaced recording is never served stale results. The
+    # path is resolved first: a subject may exist only as a mapped copy.
+    size, mtime_ns = dataset_version(resolve_dataset(dataset_path))
+    key = json.dumps([params, size, mtime_ns], sort_keys=True)
+    digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+    name = os.path.splitext(os.path.basename(dataset_path))[0]
+    return os.path.join(cache_dir, f"{name}_{digest}{suffix}")
+
+
+def _extract_to_file(dataset_path, params, path):
+    features = extract_features(dataset_path, **params)
+    # Sessions are threads of one process and may extract the same subject
+    # at once, so each writer gets its own temp file.
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp.npz')
+    with os.fdopen(fd, 'wb') as f:
+        np.savez(f, **features)
+    os.replace(tmp, path)
+    return path
+
+
+class FeatureStore:
+    # Band-power features on disk, one uncompressed .npz per subject and
+    # parameter set.
+    def __init__(self, cache_dir='.feature_cache', data_dir='.'):
+        self.cache_dir = cache_dir
+        self.data_dir = data_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def dataset_path(self, subject):
+        return os.path.join(self.data_dir, subject if subject.endswith('.npz') else f"{subject}.npz")
+
+    def path(self, subject, **params):
+        return cache_path(self.cache_dir, self.dataset_path(subject), self._params(**params))
+
+    @staticmethod
+    def _params(method='welch', bands=BANDS, channels=EEG_CHANNELS, tmin=3.0, tmax=6.0, clean=True, eog=False):
+        return {'method': method, 'bands': dict(bands), 'channels': tuple(channels),
+                'tmin': tmin, 'tmax': tmax, 'clean': clean, 'eog': eog}
+
+    def _load(self, path):
+        with np.load(path) as data:
+            return {name: data[name] for name in data.files}
+
+    def get(self, subject, **params):
+        path = self.path(subject, **params)
+        if not os.path.exists(path):
+            _extract_to_file(self.dataset_path(subject), self._params(**params), path)
+        return self._load(path)
+
+    def compute_all(self, subjects=SUBJECTS, workers=None, **params):
+        paths = {subject: self.path(subject, **params) for subject in subjects}
+        missing = [s for s, p in paths.items() if not os.path.exists(p)]
+
+        if missing:
+            extract_params = self._params(**params)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = [pool.submit(_extract_to_file, self.dataset_path(s), extract_params, paths[s])
+                           for s in missing]
+                for future in futures:
+                    future.result()
+
+        return {subject: self._load(path) for subject, path in paths.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract mu/beta band power for every subject.")
+    parser.add_argument('subjects', nargs='*', default=SUBJECTS)
+    parser.add_argument('--method', choices=['welch', 'filterbank'], default='welch')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--data-dir', default='.')
+    parser.add_argument('--cache-dir', default='.feature_cache')
+    args = parser.parse_args()
+
+    store = FeatureStore(cache_dir=args.cache_dir, data_dir=args.data_dir)
+    start = time.perf_counter()
+    features = store.compute_all(args.subjects, workers=args.workers, method=args.method)
+    elapsed = time.perf_counter() - start
+
+    for subject, f in features.items():
+        means = class_means(f)
+        summary = ', '.join(f"{name}: mu={p[:, 0].mean():.2f} beta={p[:, 1].mean():.2f}"
+                            for name, p in means.items())
+        print(f"{subject} ({len(f['labels'])} trials) {summary}")
+    print(f"{len(features)} subjects in {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+import numpy as np
+import plotly.graph_objects as go
+
+from camera_utils import BRAIN_REGIONS
+
+REGIONS = BRAIN_REGIONS
+REGION_TITLES = {'C3': 'Left Brain (C3)', 'Cz': 'Middle Brain (Cz)', 'C4': 'Right Brain (C4)'}
+ACTIVE_COLOR = 'rgba(255, 0, 0, 0.7)'
+RESTING_COLOR = 'rgba(0, 0, 255, 0.7)'
+COMPACT_MARGIN = dict(l=20, r=20, t=40, b=20)
+
+
+def brain_region_figure(active_brain_regions, title="Brain Activity Based on Movement", margin=COMPACT_MARGIN):
+    brain_fig = go.Figure()
+
+    for i, region in enumerate(REGIONS):
+        info = active_brain_regions[region]
+        color = ACTIVE_COLOR if info['active'] else RESTING_COLOR
+        text = region_text(region, info)
+        brain_fig.add_trace(go.Scatter(
+            x=[i-0.4, i+0.4, i+0.4, i-0.4, i-0.4],
+            y=[-0.4, -0.4, 0.4, 0.4, -0.4],
+            fill="toself",
+            fillcolor=color,
+            line=dict(color='black'),
+            mode='lines',
+            name=region,
+            text=text,
+            hoverinfo='text'
+        ))
+
+        brain_fig.add_annotation(
+            x=i, y=0,
+            text=region,
+            showarrow=False,
+            font=dict(color='white', size=14)
+        )
+
+        if info['active'] and info.get('body_part'):
+            brain_fig.add_annotation(
+                x=i, y=0.6,
+                text=f"Active: {info['body_part']}",
+                showarrow=False,
+                font=dict(color='black', size=12),
+                bgcolor='rgba(255, 255, 255, 0.7)'
+            )
+
+    brain_fig.update_layout(
+        title=title,
+        xaxis=dict(showticklabels=False, range=[-1, 3]),
+        yaxis=dict(showticklabels=False, range=[-1, 1]),
+        showlegend=False,
+        height=300,
+        margin=margin
+    )
+    return brain_fig
+
+
+def signal_figure(signal_segment, region, active, webgl=False):
+    fig = go.Figure()
+    trace = go.Scattergl if webgl else go.Scatter
+    fig.add_trace(trace(
+        y=signal_segment,
+        mode='lines',
+        name=region,
+        line=dict(color='red' if active else 'blue', width=2)
+    ))
+
+    fig.update_layout(
+        title=REGION_TITLES[region],
+        yaxis_title="Signal Strength",
+        xaxis_title="Time",
+        height=150,
+        margin=COMPACT_MARGIN
+    )
+    return fig
+
+
+def live_figures(active_brain_regions, signal_segments):
+    # The four figures pushed on every camera-loop iteration.
+    return [brain_region_figure(active_brain_regions)] + [
+        signal_figure(signal_segments[i], region, active_brain_regions[region]['active'])
+        for i, region in enumerate(REGIONS)
+    ]
+
+
+def region_text(region, info):
+    text = f"{region}: {'Active' if info['active'] else 'Resting'}"
+    if 'score' in info:
+        text += f" ({info['score']:.0%} motion)"
+    return text
+
+
+class LiveFigures:
+    # The four live figures built once. update() only writes what changes
+    # between frames (fill colours, labels, y-values) into the existing
+    # traces and reports which figures changed; the brain map is skipped
+    # while its state is unchanged. Motion scores enter that state in
+    # `score_step` increments, so small jitter does not re-send the map. The
+    # line charts use WebGL traces; the brain map keeps SVG since it is three
+    # filled rectangles.
+    def __init__(self, num_points=100, webgl=True, score_step=0.1):
+        resting = {region: {'active': False, 'body_part': None} for region in REGIONS}
+        self.brain = brain_region_figure(resting)
+        # One hidden body-part label per region, toggled instead of added.
+        for i, region in enumerate(REGIONS):
+            self.brain.add_annotation(
+                x=i, y=0.6, text="", visible=False, showarrow=False,
+                font=dict(color='black', size=12), bgcolor='rgba(255, 255, 255, 0.7)'
+            )
+        self.signals = [signal_figure(np.zeros(num_points), region, False, webgl=webgl) for region in REGIONS]
+        self.figures = [self.brain] + self.signals
+        self.score_step = score_step
+        self._brain_state = None
+
+    def update(self, active_brain_regions, signal_segments):
+        changed = []
+
+        step = self.score_step
+        state = tuple((info['active'], info.get('body_part'), round(info.get('score', 0.0) / step))
+                      for info in (active_brain_regions[region] for region in REGIONS))
+        if state != self._brain_state:
+            self._brain_state = state
+            labels = self.brain.layout.annotations[len(REGIONS):]
+            with self.brain.batch_update():
+                for i, region in enumerate(REGIONS):
+                    info = active_brain_regions[region]
+                    # The hover shows the quantised score the state was keyed on.
+                    shown = dict(info, score=state[i][2] * step) if 'score' in info else info
+                    self.brain.data[i].fillcolor = ACTIVE_COLOR if info['active'] else RESTING_COLOR
+                    self.brain.data[i].text = region_text(region, shown)
+                    labels[i].visible = bool(info['active'] and info.get('body_part'))
+                    labels[i].text = f"Active: {info.get('body_part')}"
+            changed.append(0)
+
+        # The signals move on every step, so the line charts always change.
+        for i, (fig, region) in enumerate(zip(self.signals, REGIONS)):
+            with fig.batch_update():
+                fig.data[0].y = signal_segments[i]
+                fig.data[0].line.color = 'red' if active_brain_regions[region]['active'] else 'blue'
+            changed.append(i + 1)
+
+        return changed
@@ -0,0 +1,97 @@
+import numpy as np
+
+
+def _pool_pairs(a, reduce):
+    if a.shape[1] % 2:
+        a = np.concatenate([a, a[:, -1:]], axis=1)
+    pairs = a.reshape(a.shape[0], -1, 2)
+    return reduce(pairs[..., 0], pairs[..., 1])
+
+
+def _nan_mean(a, b):
+    total = np.where(np.isnan(a), 0, a) + np.where(np.isnan(b), 0, b)
+    count = (~np.isnan(a)).astype(a.dtype) + (~np.isnan(b))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return total / count
+
+
+class HeatmapPyramid:
+    # Level k pools 2**k samples per bin along the time axis. 'mean' serves one
+    # column per bin; 'minmax' serves the bin minimum and maximum side by side,
+    # so short peaks survive decimation.
+    def __init__(self, matrix, mode='minmax', min_bins=32, dtype=np.float32):
+        if mode not in ('mean', 'minmax'):
+            raise ValueError(f"Unknown pooling mode: {mode}")
+
+        self.mode = mode
+        self.shape = matrix.shape
+        base = np.asarray(matrix, dtype=dtype)
+        self.levels = [(base, base)] if mode == 'minmax' else [base]
+
+        while self._bins(len(self.levels) - 1) > min_bins:
+            prev = self.levels[-1]
+            if mode == 'minmax':
+                self.levels.append((_pool_pairs(prev[0], np.fmin),
+                                    _pool_pairs(prev[1], np.fmax)))
+            else:
+                self.levels.append(_pool_pairs(prev, _nan_mean))
+
+    @property
+    def nbytes(self):
+        if self.mode == 'minmax':
+            return self.levels[0][0].nbytes + sum(lo.nbytes + hi.nbytes for lo, hi in self.levels[1:])
+        return sum(level.nbytes for level in self.levels)
+
+    def _bins(self, level):
+        return -(-self.shape[1] // 2 ** level)
+
+    def _columns(self, bins, level):
+        # Level 0 is served raw, one column per sample, in both modes.
+        return 2 * bins if self.mode == 'minmax' and level > 0 else bins
+
+    def level_for(self, width_px, x_range=None):
+        start, stop = x_range or (0, self.shape[1])
+        for level in range(len(self.levels)):
+            size = 2 ** level
+            bins = -(-stop // size) - start // size
+            if self._columns(bins, level) <= width_px:
+                return level
+        return len(self.levels) - 1
+
+    def get(self, width_px, x_range=None, y_range=None):
+        # (z, x, y) for a viewport `width_px` columns wide. `x_range` is a
+        # (start, stop) window in samples and `y_range` one in trials; x holds
+        # the first sample of each served column and y the trial numbers.
+        x_start, x_stop = x_range or (0, self.shape[1])
+        y_start, y_stop = y_range or (0, self.shape[0])
+        x_start, x_stop = max(0, int(x_start)), min(self.shape[1], int(x_stop))
+        y_start, y_stop = max(0, int(y_start)), min(self.shape[0], int(y_stop))
+
+        level = self.level_for(width_px, (x_start, x_stop))
+        size = 2 ** level
+        b_start, b_stop = x_start // size, -(-x_stop // size)
+        rows = slice(y_start, y_stop)
+        x = np.arange(b_start, b_stop) * size
+
+        if self.mode == 'minmax':
+            lo, hi = self.levels[level]
+            if level == 0:
+                z = lo[rows, b_start:b_stop]
+            else:
+                z = np.empty((y_stop - y_start, 2 * (b_stop - b_start)), dtype=lo.dtype)
+                z[:, 0::2] = lo[rows, b_start:b_stop]
+                z[:, 1::2] = hi[rows, b_start:b_stop]
+                x = np.repeat(x, 2)
+                x[1::2] += size // 2
+        else:
+            z = self.levels[level][rows, b_start:b_stop]
+
+        return z, x, np.arange(y_start, y_stop)
+
+
+def get_heatmap_pyramid(dataset, channel, mode='minmax', clean=True, eog=False):
+    def build():
+        epochs, _ = dataset.get_epochs([channel], clean=clean, eog=eog)
+        return HeatmapPyramid(epochs[:, 0], mode=mode)
+
+    return dataset.cache.get(dataset.path, ('heatmap_pyramid', channel, mode, clean, eog), build)
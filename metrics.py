@@ -0,0 +1,224 @@
+import os
+import tempfile
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class StageTimer:
+    # Rolling per-stage latencies for a frame loop. Each stage keeps its last
+    # `window` durations for percentiles plus lifetime totals, and `tick()`
+    # marks the end of a frame for the effective FPS. A lock keeps snapshots
+    # consistent when a scrape thread reads while the loop writes.
+    def __init__(self, window=300):
+        self.window = window
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.samples = {}
+            self.totals = {}
+            self.counts = {}
+            self.frames = deque(maxlen=self.window)
+            self.frame_count = 0
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name, seconds):
+        with self.lock:
+            if name not in self.samples:
+                self.samples[name] = deque(maxlen=self.window)
+                self.totals[name] = 0.0
+                self.counts[name] = 0
+            self.samples[name].append(seconds)
+            self.totals[name] += seconds
+            self.counts[name] += 1
+
+    def tick(self):
+        with self.lock:
+            self.frames.append(time.perf_counter())
+            self.frame_count += 1
+
+    def fps(self):
+        with self.lock:
+            if len(self.frames) < 2:
+                return 0.0
+            return (len(self.frames) - 1) / (self.frames[-1] - self.frames[0])
+
+    def summary(self):
+        samples, totals, counts, _ = self.snapshot()
+
+        # Share of the recent frame time spent in each stage.
+        recent = sum(values.sum() for values in samples.values()) or 1.0
+        summary = {}
+        for name, values in samples.items():
+            p50, p95, p99 = np.percentile(values, [q * 100 for q in QUANTILES]) * 1000
+            summary[name] = {
+                'count': counts[name],
+                'total_s': totals[name],
+                'mean_ms': float(values.mean() * 1000),
+                'p50_ms': float(p50),
+                'p95_ms': float(p95),
+                'p99_ms': float(p99),
+                'share': float(values.sum() / recent),
+            }
+        return summary
+
+    def snapshot(self):
+        with self.lock:
+            samples = {name: np.array(values) for name, values in self.samples.items()}
+            return samples, dict(self.totals), dict(self.counts), self.frame_count
+
+    def to_text(self, prefix='syncwave_camera'):
+        return exposition({None: self}, prefix)
+
+    def dump(self, path):
+        _write_atomic(path, self.to_text())
+
+
+class TimerRegistry:
+    # Named StageTimers exported together, each series labelled with its
+    # name. Every Streamlit session times its own loop in its own timer, so
+    # sessions never reset or mix each other's numbers. Timers are held
+    # weakly and leave the export once their owner (the session state or the
+    # shared pipeline) is gone.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._timers = weakref.WeakValueDictionary()
+
+    def get(self, name, window=300):
+        with self.lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                timer = self._timers[name] = StageTimer(window)
+            return timer
+
+    def timers(self):
+        with self.lock:
+            return dict(self._timers)
+
+    def to_text(self, prefix='syncwave_camera'):
+        return exposition(self.timers(), prefix)
+
+    def dump(self, path):
+        _write_atomic(path, self.to_text())
+
+
+def _write_atomic(path, text):
+    # Sessions are threads of one process, so the temp file must be unique
+    # per writer, not per pid.
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def exposition(timers, prefix='syncwave_camera'):
+    # Prometheus text exposition format. `timers` maps a session name to its
+    # StageTimer; a None name exports the timer without a session label.
+    stages = [
+        f"# HELP {prefix}_stage_seconds Per-stage latency of the camera loop.",
+        f"# TYPE {prefix}_stage_seconds summary",
+    ]
+    fps = [
+        f"# HELP {prefix}_fps Effective frames per second over the rolling window.",
+        f"# TYPE {prefix}_fps gauge",
+    ]
+    frames = [
+        f"# HELP {prefix}_frames_total Frames completed.",
+        f"# TYPE {prefix}_frames_total counter",
+    ]
+    for session, timer in timers.items():
+        samples, totals, counts, frame_count = timer.snapshot()
+        label = '' if session is None else f'session="{session}",'
+        for name, values in samples.items():
+            for q, value in zip(QUANTILES, np.percentile(values, [q * 100 for q in QUANTILES])):
+                stages.append(f'{prefix}_stage_seconds{{{label}stage="{name}",quantile="{q}"}} {value:.6g}')
+            stages.append(f'{prefix}_stage_seconds_sum{{{label}stage="{name}"}} {totals[name]:.6g}')
+            stages.append(f'{prefix}_stage_seconds_count{{{label}stage="{name}"}} {counts[name]}')
+        suffix = f"{{{label.rstrip(',')}}}" if label else ''
+        fps.append(f"{prefix}_fps{suffix} {timer.fps():.6g}")
+        frames.append(f"{prefix}_frames_total{suffix} {frame_count}")
+    return '\n'.join(stages + fps + frames) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    source = None
+
+    def do_GET(self):
+        if self.path.rstrip('/') not in ('', '/metrics'):
+            self.send_error(404)
+            return
+        body = self.source.to_text().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_servers = {}
+_servers_lock = threading.Lock()
+
+
+def serve(source, port, host='127.0.0.1'):
+    # Expose `source` (a StageTimer or TimerRegistry) on
+    # http://host:port/metrics from a daemon thread. Safe to call on every
+    # Streamlit rerun, from concurrent sessions: one server per port per
+    # process.
+    with _servers_lock:
+        if port not in _servers:
+            handler = type('MetricsHandler', (_MetricsHandler,), {'source': source})
+            server = ThreadingHTTPServer((host, port), handler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            _servers[port] = server
+        return _servers[port]
+
+
+_writers = {}
+
+
+def _write_forever(source, path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            source.dump(path)
+        except OSError:
+            # A full disk or a moved directory must not end the export.
+            pass
+
+
+def export(source, path, interval=1.0):
+    # Rewrite `path` with `source`'s metrics every `interval` seconds from a
+    # daemon thread. Like serve(), one writer per path per process, however
+    # many sessions call it.
+    with _servers_lock:
+        if path not in _writers:
+            thread = threading.Thread(target=_write_forever, args=(source, path, interval), daemon=True)
+            thread.start()
+            _writers[path] = thread
+        return _writers[path]
+
+
+camera_timers = TimerRegistry()
@@ -0,0 +1,94 @@
+import cv2
+import numpy as np
+
+
+# Each engine turns a blurred grayscale frame into a binary foreground mask
+# (0/255), or None while it has not seen enough frames yet. `blur` is the
+# Gaussian kernel the engine wants at full resolution; MotionDetector scales it
+# with the processing resolution.
+class FrameDifferenceEngine:
+    name = 'frame_diff'
+    label = 'Frame differencing'
+    blur = 21
+
+    def __init__(self):
+        self.prev = None
+
+    def reset(self):
+        self.prev = None
+
+    def apply(self, gray, threshold):
+        prev, self.prev = self.prev, gray
+        if prev is None:
+            return None
+        delta = cv2.absdiff(prev, gray)
+        return cv2.threshold(delta, threshold, 255, cv2.THRESH_BINARY)[1]
+
+
+class RunningAverageEngine:
+    name = 'running_average'
+    label = 'Running average'
+    blur = 11
+
+    def __init__(self, alpha=0.05, warmup=5):
+        self.alpha = alpha
+        self.warmup = warmup
+        self.reset()
+
+    def reset(self):
+        self.background = None
+        self.frames = 0
+
+    def apply(self, gray, threshold):
+        if self.background is None:
+            self.background = gray.astype(np.float32)
+        # Learn faster while warming up so the first frames do not leave a
+        # ghost of the initial scene behind.
+        alpha = self.alpha if self.frames >= self.warmup else 0.5
+        delta = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        cv2.accumulateWeighted(gray, self.background, alpha)
+        self.frames += 1
+        if self.frames <= self.warmup:
+            return None
+        return cv2.threshold(delta, threshold, 255, cv2.THRESH_BINARY)[1]
+
+
+class MixtureModelEngine:
+    name = 'mog2'
+    label = 'Mixture of Gaussians'
+    blur = 5
+
+    def __init__(self, history=200, var_threshold=16, warmup=5):
+        self.history = history
+        self.var_threshold = var_threshold
+        self.warmup = warmup
+        self.reset()
+
+    def reset(self):
+        self.subtractor = cv2.createBackgroundSubtractorMOG2(
+            history=self.history, varThreshold=self.var_threshold, detectShadows=False
+        )
+        self.frames = 0
+
+    def apply(self, gray, threshold):
+        mask = self.subtractor.apply(gray)
+        self.frames += 1
+        if self.frames <= self.warmup:
+            return None
+        # The mixture model is noisier per pixel than differencing a heavily
+        # blurred frame; a small median filter removes isolated speckles.
+        return cv2.medianBlur(mask, 5)
+
+
+ENGINES = {
+    engine.name: engine
+    for engine in (FrameDifferenceEngine, RunningAverageEngine, MixtureModelEngine)
+}
+
+
+def create_engine(engine='frame_diff', **kwargs):
+    if not isinstance(engine, str):
+        return engine
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown motion engine: {engine} (choose from {', '.join(ENGINES)})")
+    return ENGINES[engine](**kwargs)
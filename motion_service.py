@@ -0,0 +1,259 @@
+import threading
+import time
+from collections import deque
+
+from camera_utils import MotionDetector
+from pacing import FramePacer
+
+
+class Subscription:
+    # One viewer's bounded view of a MotionService. When the viewer falls
+    # behind, the oldest results are dropped, so a slow session never stalls
+    # the pipeline or the other viewers.
+    def __init__(self, service, maxsize=2, idle_timeout=None):
+        self.service = service
+        self.queue = deque(maxlen=maxsize)
+        self.idle_timeout = idle_timeout
+        self.received = 0
+        self.dropped = 0
+        self.closed = False
+        self.last_read = time.monotonic()
+        self._cond = threading.Condition()
+
+    @property
+    def settings(self):
+        return self.service.settings
+
+    def _put(self, result):
+        with self._cond:
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1
+            self.queue.append(result)
+            self.received += 1
+            self._cond.notify_all()
+
+    def _end(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+    def idle(self, now):
+        return self.idle_timeout is not None and now - self.last_read > self.idle_timeout
+
+    def get(self, timeout=None):
+        # Oldest pending result, or None on timeout or once the service has
+        # stopped and the queue is drained.
+        with self._cond:
+            self.last_read = time.monotonic()
+            if not self._cond.wait_for(lambda: self.queue or self.closed, timeout):
+                return None
+            return self.queue.popleft() if self.queue else None
+
+    def get_latest(self, timeout=None):
+        # Newest result; anything older still queued counts as dropped.
+        with self._cond:
+            self.last_read = time.monotonic()
+            if not self._cond.wait_for(lambda: self.queue or self.closed, timeout):
+                return None
+            if not self.queue:
+                return None
+            self.dropped += len(self.queue) - 1
+            result = self.queue[-1]
+            self.queue.clear()
+            return result
+
+    def close(self):
+        self.service.release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MotionService:
+    # A single capture and detection pipeline for one source, shared by any
+    # number of subscribers. The source is opened when the first subscriber
+    # arrives and released when the last one leaves. Every result is a dict
+    # with the annotated frame (read-only, shared by all subscribers), the
+    # active brain and body regions, their cooldowns and the region scores.
+    # With a `target_fps` the pipeline is paced by a FramePacer: detection
+    # drops to `idle_fps` while nothing moves and skips alternate frames when
+    # it cannot keep up.
+    def __init__(self, source=0, processing_scale=1.0, roi_only=False, engine='frame_diff',
+                 mirror=None, realtime=None, timer=None, target_fps=None, idle_fps=2.0, idle_after=5.0):
+        self.source = source
+        self.settings = {'processing_scale': processing_scale, 'roi_only': roi_only, 'engine': engine}
+        self.mirror = mirror
+        self.realtime = realtime
+        self.timer = timer
+        self.pacer = FramePacer(target_fps, idle_fps, idle_after) if target_fps else None
+        self.detector = None
+        self.subscribers = []
+        self.frames = 0
+        self.error = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def refcount(self):
+        return len(self.subscribers)
+
+    def subscribe(self, maxsize=2, idle_timeout=None):
+        subscription = Subscription(self, maxsize, idle_timeout)
+        with self._lock:
+            if not self.running:
+                self._start()
+            self.subscribers = self.subscribers + [subscription]
+        return subscription
+
+    def release(self, subscription):
+        run = None
+        with self._lock:
+            subscription._end()
+            if subscription in self.subscribers:
+                self.subscribers = [s for s in self.subscribers if s is not subscription]
+                if not self.subscribers:
+                    run = self._detach()
+        self._shutdown(run)
+
+    def _release_idle(self, now, stop_event):
+        # Viewers that went away without unsubscribing are released once,
+        # under the lock, and only while this loop's run is still current.
+        run = None
+        with self._lock:
+            if stop_event.is_set():
+                return
+            idle = [s for s in self.subscribers if s.idle(now)]
+            self.subscribers = [s for s in self.subscribers if s not in idle]
+            for subscription in idle:
+                subscription._end()
+            if idle and not self.subscribers:
+                run = self._detach()
+        self._shutdown(run)
+
+    def _start(self):
+        self.detector = MotionDetector(**self.settings)
+        self.detector.start_camera(self.source, realtime=self.realtime, mirror=self.mirror)
+        self.frames = 0
+        self.error = None
+        if self.pacer is not None:
+            self.pacer.reset()
+        # Each run has its own stop event: a loop that outlives a timed-out
+        # join still sees its own event set, even after a restart.
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(self._stop_event, self.detector), daemon=True)
+        self._thread.start()
+
+    def _detach(self):
+        # Called under the lock: signals the current run to stop and forgets
+        # it, so a new subscriber starts a fresh run straight away. Releasing
+        # the camera and joining the loop are left to _shutdown(), outside
+        # the lock, so they never hold up other subscribers.
+        run = (self.detector, self._thread)
+        if self._stop_event is not None:
+            self._stop_event.set()
+        self._thread = None
+        return run
+
+    def _shutdown(self, run, timeout=2.0):
+        if run is None:
+            return
+        detector, thread = run
+        if detector is not None:
+            detector.stop_camera()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def _run(self, stop_event, detector):
+        pacer = self.pacer
+        try:
+            while not stop_event.is_set():
+                frame = detector.get_frame(timeout=0.5)
+                if frame is None:
+                    if detector.ring.closed:
+                        break
+                    continue
+
+                if pacer is not None:
+                    pacer.begin()
+                    if not pacer.should_process():
+                        pacer.wait()
+                        continue
+
+                start = time.perf_counter()
+                timestamp = time.time()
+                processed, _ = detector.detect_motion(frame, timestamp)
+                active_brain_regions = detector.get_active_brain_regions()
+                if self.timer is not None:
+                    self.timer.record('detect', time.perf_counter() - start)
+                    self.timer.tick()
+                if pacer is not None:
+                    pacer.motion(any(info['active'] for info in active_brain_regions.values()))
+
+                processed.setflags(write=False)
+                self.frames += 1
+                result = {
+                    'seq': self.frames,
+                    'timestamp': timestamp,
+                    'frame': processed,
+                    'active_brain_regions': active_brain_regions,
+                    'active_regions': dict(detector.active_regions),
+                    # Seconds each body region stays active without new motion.
+                    'cooldown': {r: max(0.0, t - timestamp) for r, t in detector.cooldown.items()},
+                    'region_scores': dict(detector.region_scores),
+                    'detection_info': dict(detector.detection_info),
+                }
+
+                # Subscribers is replaced, never mutated, so this snapshot is
+                # safe without the lock.
+                now = time.monotonic()
+                if any(subscription.idle(now) for subscription in self.subscribers):
+                    self._release_idle(now, stop_event)
+                for subscription in self.subscribers:
+                    subscription._put(result)
+
+                if pacer is not None:
+                    pacer.wait()
+        except Exception as e:
+            self.error = e
+        finally:
+            # A deliberate stop has already ended this run's subscribers. When
+            # the source ends or fails, they are dropped here, so the next
+            # subscribe starts a clean run.
+            ended = None
+            with self._lock:
+                if not stop_event.is_set():
+                    ended, self.subscribers = self.subscribers, []
+                    stop_event.set()
+                    self._thread = None
+            if ended is not None:
+                for subscription in ended:
+                    subscription._end()
+                detector.stop_camera()
+
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+def subscribe(source=0, maxsize=2, idle_timeout=None, **settings):
+    # Process-wide entry point: every caller asking for the same source shares
+    # one pipeline. `settings` (MotionService arguments) only take effect when
+    # the pipeline is started; later subscribers see `subscription.settings`.
+    with _services_lock:
+        service = _services.get(source)
+        if service is None or not service.running:
+            service = _services[source] = MotionService(source, **settings)
+        return service.subscribe(maxsize, idle_timeout)
+
+
+def services():
+    with _services_lock:
+        return dict(_services)
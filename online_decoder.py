@@ -0,0 +1,213 @@
+import argparse
+import os
+import tempfile
+import time
+from collections import deque
+
+import joblib
+import numpy as np
+from scipy import signal
+
+from dataset_utils import MotorImageryDataset
+from decoding import MI_CLASSES, DecodingStore, bandpass_sos, make_decoder
+from features import EEG_CHANNELS, cache_path
+
+
+class StreamingFilter:
+    # Causal SOS filter whose state carries over between blocks, so each
+    # sample is filtered exactly once.
+    def __init__(self, sos, n_channels):
+        self.sos = sos
+        self.n_channels = n_channels
+        self.zi = None
+
+    def reset(self):
+        self.zi = None
+
+    def process(self, block):
+        if self.zi is None:
+            # Start in steady state for the first sample to avoid a step
+            # transient at stream start.
+            self.zi = signal.sosfilt_zi(self.sos)[:, None, :] * block[None, :, :1]
+        out, self.zi = signal.sosfilt(self.sos, block, axis=-1, zi=self.zi)
+        return out
+
+
+class OnlineDecoder:
+    # Consumes (channels, samples) blocks of any size and emits class
+    # probabilities for the last `window` samples every `hop` samples. Filtered
+    # samples go into a linear buffer that is compacted only when full, so
+    # every window is a contiguous slice and all windows ending inside a block
+    # are classified in one batched call.
+    def __init__(self, model, fs=250, window=2.0, hop=0.1, band=(8, 30), n_channels=len(EEG_CHANNELS),
+                 history=1000):
+        self.model = model
+        self.classes = model.classes_
+        self.fs = fs
+        self.window = int(window * fs)
+        self.hop = int(hop * fs)
+        self.filter = StreamingFilter(bandpass_sos(fs, band), n_channels)
+        self.buffer = np.zeros((n_channels, 4 * self.window))
+        self.latencies = deque(maxlen=history)
+        self.reset()
+
+    def reset(self):
+        self.filter.reset()
+        self.end = 0
+        self.total = 0
+        self.latencies.clear()
+
+    def process(self, block):
+        start = time.perf_counter()
+        block = self.filter.process(np.nan_to_num(block))
+        n = block.shape[1]
+
+        if self.end + n > self.buffer.shape[1]:
+            keep = min(self.end, self.window)
+            tail = self.buffer[:, self.end - keep:self.end]
+            if keep + n > self.buffer.shape[1]:
+                grown = np.zeros((self.buffer.shape[0], keep + n + self.window))
+                grown[:, :keep] = tail
+                self.buffer = grown
+            else:
+                self.buffer[:, :keep] = tail
+            self.end = keep
+        self.buffer[:, self.end:self.end + n] = block
+        self.end += n
+
+        first = self.total + 1
+        self.total += n
+        # Stream positions in this block that fall on a hop boundary and have
+        # a full window behind them.
+        stops = np.arange(-(-first // self.hop) * self.hop, self.total + 1, self.hop)
+        stops = stops[stops >= self.window]
+
+        probabilities = np.empty((0, len(self.classes)))
+        if len(stops):
+            offsets = self.end - (self.total - stops)
+            windows = np.stack([self.buffer[:, o - self.window:o] for o in offsets])
+            probabilities = self.model.predict_proba(windows)
+
+        self.latencies.append(time.perf_counter() - start)
+        return stops, probabilities
+
+    def stats(self, block_size):
+        latencies = np.array(self.latencies) * 1000
+        block_ms = block_size / self.fs * 1000
+        if not len(latencies):
+            return {'blocks': 0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0,
+                    'realtime_factor': 0.0}
+        return {
+            'blocks': len(latencies),
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'max_ms': float(latencies.max()),
+            # How many streams of this size one core could keep up with.
+            'realtime_factor': float(block_ms / latencies.mean()),
+        }
+
+
+def _source(dataset, eog=False):
+    return dataset.get_eog_corrected() if eog else dataset.raw
+
+
+def load_online_data(dataset, band=(8, 30), tmin=2.5, window=2.0, channels=EEG_CHANNELS, clean=True, eog=False):
+    # Training windows cut the way the online path sees the signal: the whole
+    # recording goes through the causal StreamingFilter in one pass (not the
+    # zero-phase filter of the offline evaluation), and each trial gives the
+    # `window` seconds from `tmin` after its start.
+    if isinstance(dataset, str):
+        dataset = MotorImageryDataset(dataset)
+    raw = np.nan_to_num(_source(dataset, eog)[list(channels)])
+    filtered = StreamingFilter(bandpass_sos(dataset.Fs, band), len(channels)).process(raw)
+
+    index = dataset.get_trial_index()
+    selected = dataset.select_trials(label=list(MI_CLASSES), clean=clean)
+    length = int(window * dataset.Fs)
+    starts = index['start'][selected] + int(tmin * dataset.Fs)
+    inside = starts + length <= filtered.shape[1]
+    windows = np.lib.stride_tricks.sliding_window_view(filtered, length, axis=1)
+    return windows[:, starts[inside]].transpose(1, 0, 2), index['label'][selected][inside]
+
+
+def fit_online_model(dataset, n_components=4, band=(8, 30), tmin=2.5, window=2.0, clean=True, eog=False):
+    X, y = load_online_data(dataset, band, tmin, window, clean=clean, eog=eog)
+    return make_decoder(n_components).fit(X, y)
+
+
+def online_model(store, subject, n_components=4, band=(8, 30), tmin=2.5, window=2.0, clean=True, eog=False):
+    # The served model is fitted on causally filtered windows of the decoder's
+    # own length and cached next to the offline results in `store`.
+    params = {'online': True, 'n_components': n_components, 'band': tuple(band), 'tmin': tmin, 'window': window,
+              'clean': clean, 'eog': eog}
+    path = cache_path(store.cache_dir, store.dataset_path(subject), params, '.joblib')
+    if os.path.exists(path):
+        return joblib.load(path)
+
+    model = fit_online_model(store.dataset_path(subject), n_components, band, tmin, window, clean, eog)
+    # Sessions fitting the same model at once each write their own temp file.
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        joblib.dump(model, f)
+    os.replace(tmp, path)
+    return model
+
+
+def replay_blocks(dataset, block_size=25, channels=EEG_CHANNELS, start=0, stop=None, eog=False):
+    if isinstance(dataset, str):
+        dataset = MotorImageryDataset(dataset)
+    raw = _source(dataset, eog)
+    raw = raw[list(channels)] if channels is not None else raw
+    stop = raw.shape[1] if stop is None else min(stop, raw.shape[1])
+    for position in range(start, stop - block_size + 1, block_size):
+        yield position, raw[:, position:position + block_size]
+
+
+def run_replay(dataset, model, block_size=25, window=2.0, hop=0.1, start=0, stop=None, eog=False):
+    if isinstance(dataset, str):
+        dataset = MotorImageryDataset(dataset)
+    decoder = OnlineDecoder(model, fs=dataset.Fs, window=window, hop=hop)
+
+    positions, probabilities = [], []
+    for _, block in replay_blocks(dataset, block_size, start=start, stop=stop, eog=eog):
+        stops, probs = decoder.process(block)
+        positions.append(stops + start)
+        probabilities.append(probs)
+
+    if not positions:
+        # Shorter than one block: nothing was classified.
+        return np.empty(0, dtype=np.int64), np.empty((0, len(decoder.classes))), decoder.stats(block_size)
+    return np.concatenate(positions), np.concatenate(probabilities), decoder.stats(block_size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recording through the online decoder.")
+    parser.add_argument('subject', nargs='?', default='A01T')
+    parser.add_argument('--block', type=int, default=25, help="Samples per block (25 = 100 ms at 250 Hz)")
+    parser.add_argument('--window', type=float, default=2.0)
+    parser.add_argument('--hop', type=float, default=0.1)
+    parser.add_argument('--seconds', type=float, default=None, help="Only replay the first N seconds")
+    parser.add_argument('--data-dir', default='.')
+    args = parser.parse_args()
+
+    store = DecodingStore(data_dir=args.data_dir)
+    model = online_model(store, args.subject, window=args.window)
+    dataset = MotorImageryDataset(store.dataset_path(args.subject))
+    stop = int(args.seconds * dataset.Fs) if args.seconds else None
+
+    start = time.perf_counter()
+    positions, probabilities, stats = run_replay(dataset, model, args.block, args.window, args.hop, stop=stop)
+    elapsed = time.perf_counter() - start
+
+    duration = (positions[-1] if len(positions) else 0) / dataset.Fs
+    print(f"{len(positions)} predictions over {duration:.0f}s of signal in {elapsed:.2f}s "
+          f"({duration / elapsed:.0f}x real time)")
+    print(f"block latency p50={stats['p50_ms']:.3f}ms p95={stats['p95_ms']:.3f}ms "
+          f"p99={stats['p99_ms']:.3f}ms max={stats['max_ms']:.3f}ms")
+    print(f"headroom: {stats['realtime_factor']:.0f} streams of {len(EEG_CHANNELS)} channels "
+          f"at {dataset.Fs} Hz per core")
+
+
+if __name__ == '__main__':
+    main()
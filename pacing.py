@@ -0,0 +1,87 @@
+import time
+
+
+class FramePacer:
+    # Paces a processing loop to a target frame rate instead of sleeping a
+    # fixed amount. Every iteration's cost is measured and the loop only
+    # sleeps for what is left of the frame budget. When the smoothed cost is
+    # over budget, should_process() returns False on alternate frames so the
+    # caller can shed detection or rendering work. After `idle_after`
+    # seconds without motion the loop drops to `idle_fps`; reporting motion
+    # puts it back on the target rate from the very next wait().
+    def __init__(self, target_fps=10.0, idle_fps=2.0, idle_after=5.0, smoothing=0.2):
+        self.target_fps = float(target_fps)
+        self.idle_fps = float(min(idle_fps, target_fps))
+        self.idle_after = idle_after
+        self.smoothing = smoothing
+        self.reset()
+
+    def reset(self):
+        now = time.perf_counter()
+        self.frames = 0
+        self.skipped = 0
+        self.cost = None
+        self.last_motion = now
+        self._start = now
+        self._processing = True
+
+    @property
+    def budget(self):
+        return 1.0 / self.target_fps
+
+    @property
+    def idle(self):
+        return self.idle_after is not None and time.perf_counter() - self.last_motion >= self.idle_after
+
+    @property
+    def interval(self):
+        return 1.0 / self.idle_fps if self.idle else self.budget
+
+    @property
+    def overloaded(self):
+        return self.cost is not None and self.cost > self.budget
+
+    @property
+    def mode(self):
+        if self.idle:
+            return 'idle'
+        return 'shedding' if self.overloaded else 'normal'
+
+    def begin(self):
+        self._start = time.perf_counter()
+        self.frames += 1
+        self._processing = True
+
+    def should_process(self):
+        # Skipped frames are not timed, so an overloaded loop keeps
+        # alternating until the work itself gets cheaper.
+        if self.overloaded and self.frames % 2 == 0:
+            self._processing = False
+            self.skipped += 1
+        return self._processing
+
+    def motion(self, active=True):
+        if active:
+            self.last_motion = time.perf_counter()
+
+    def wait(self):
+        # Sleeps until the next frame is due and returns the time slept.
+        now = time.perf_counter()
+        if self._processing:
+            cost = now - self._start
+            self.cost = cost if self.cost is None else self.cost + self.smoothing * (cost - self.cost)
+        delay = self._start + self.interval - now
+        if delay > 0:
+            time.sleep(delay)
+            return delay
+        return 0.0
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'target_fps': self.target_fps,
+            'interval_ms': self.interval * 1000,
+            'cost_ms': (self.cost or 0.0) * 1000,
+            'frames': self.frames,
+            'skipped': self.skipped,
+        }
@@ -0,0 +1,278 @@
+import json
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+BRAIN_REGIONS = ('C3', 'Cz', 'C4')
+VIDEO_FILE = 'video.avi'
+META_FILE = 'meta.json'
+_STOP = object()
+
+
+def _write_json(path, value):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(value, f)
+    os.replace(tmp, path)
+
+
+def _columns(result, body_regions, traces):
+    # One row per recorded frame. Brain regions are always C3/Cz/C4; body
+    # regions keep the detector's order, stored once in meta.json.
+    brain = result['active_brain_regions']
+    body_part = [brain[r]['body_part'] for r in BRAIN_REGIONS]
+    return {
+        'seq': np.int64(result['seq']),
+        'timestamp': np.float64(result['timestamp']),
+        'contours': np.int32(result['detection_info'].get('contours', 0)),
+        'brain_active': np.array([brain[r]['active'] for r in BRAIN_REGIONS], dtype=bool),
+        'brain_score': np.array([brain[r].get('score', 0.0) for r in BRAIN_REGIONS], dtype=np.float32),
+        'body_part': np.array([body_regions.index(p) if p in body_regions else -1 for p in body_part],
+                              dtype=np.int8),
+        'body_active': np.array([result['active_regions'][r] for r in body_regions], dtype=bool),
+        'body_score': np.array([result['region_scores'][r] for r in body_regions], dtype=np.float32),
+        'cooldown': np.array([result['cooldown'][r] for r in body_regions], dtype=np.float32),
+        'traces': traces,
+    }
+
+
+class SessionRecorder:
+    # Records a live session to a directory: the processed frames as video
+    # and one raw, append-only file per activity column (<name>.bin, layout
+    # in meta.json). record() only enqueues and never blocks the camera
+    # loop; when the bounded queue is full the row is dropped and counted.
+    # Encoding and file writes happen on the writer thread. `fps` is only the
+    # video container's nominal rate: the pipeline idles at a lower rate and
+    # sheds frames, so the recorded timestamps are what replay follows.
+    def __init__(self, path, fps=10.0, maxsize=64, fourcc='MJPG', batch=16):
+        self.path = path
+        self.fps = fps
+        self.fourcc = fourcc
+        self.batch = batch
+        self.queue = queue.Queue(maxsize)
+        self.recorded = 0
+        self.dropped = 0
+        self.rows = 0
+        self.frames_written = 0
+        self.error = None
+        self.meta = None
+        self._files = {}
+        self._video = None
+        self._frame_size = None
+        # The column files are opened for append, so a session never reuses
+        # an existing directory.
+        os.makedirs(path)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def record(self, result, traces):
+        # `traces` is copied: the caller's streamer reuses its buffer.
+        if self.error is not None:
+            return False
+        item = (result, np.array(traces, dtype=np.float32))
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.recorded += 1
+        return True
+
+    def close(self, timeout=10.0):
+        if self._thread is None:
+            return
+        # A writer that has died no longer drains the queue, so the stop
+        # marker is only queued while it runs, and never waited on forever.
+        if self._thread.is_alive():
+            try:
+                self.queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                pass
+        self._thread.join(timeout)
+        self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self):
+        try:
+            stop = False
+            while not stop:
+                items = [self.queue.get()]
+                while len(items) < self.batch:
+                    try:
+                        items.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if items[-1] is _STOP:
+                    items.pop()
+                    stop = True
+                if items:
+                    self._write(items)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._finish()
+
+    def _open(self, result, traces):
+        body_regions = list(result['region_scores'])
+        height, width = result['frame'].shape[:2]
+        self._frame_size = (width, height)
+        self._video = cv2.VideoWriter(os.path.join(self.path, VIDEO_FILE),
+                                      cv2.VideoWriter_fourcc(*self.fourcc), self.fps, self._frame_size)
+        row = _columns(result, body_regions, traces)
+        self.meta = {
+            'started': result['timestamp'],
+            'nominal_fps': self.fps,
+            'frame_size': [width, height],
+            'engine': result['detection_info'].get('engine'),
+            'brain_regions': list(BRAIN_REGIONS),
+            'body_regions': body_regions,
+            'columns': {name: {'dtype': np.asarray(value).dtype.str, 'shape': list(np.shape(value))}
+                        for name, value in row.items()},
+            'rows': 0,
+            'frames': 0,
+            'dropped': 0,
+            'complete': False,
+        }
+        for name in row:
+            self._files[name] = open(os.path.join(self.path, f"{name}.bin"), 'ab')
+        _write_json(os.path.join(self.path, META_FILE), self.meta)
+
+    def _write(self, items):
+        if self.meta is None:
+            self._open(*items[0])
+        body_regions = self.meta['body_regions']
+
+        rows = []
+        for result, traces in items:
+            frame = result['frame']
+            if frame.shape[1::-1] != self._frame_size:
+                frame = cv2.resize(frame, self._frame_size)
+            self._video.write(frame)
+            self.frames_written += 1
+            rows.append(_columns(result, body_regions, traces))
+
+        # Columns are appended a batch at a time.
+        for name, f in self._files.items():
+            f.write(np.stack([row[name] for row in rows]).tobytes())
+            f.flush()
+        self.rows += len(rows)
+
+    def _finish(self):
+        if self._video is not None:
+            self._video.release()
+        for f in self._files.values():
+            f.close()
+        if self.meta is not None:
+            self.meta.update(rows=self.rows, frames=self.frames_written, dropped=self.dropped,
+                             complete=self.error is None)
+            _write_json(os.path.join(self.path, META_FILE), self.meta)
+
+
+def load_session(path):
+    # Every column as an array with one row per recorded frame. A session that
+    # was cut short is truncated to the rows present in all columns.
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    columns = {}
+    for name, spec in meta['columns'].items():
+        values = np.fromfile(os.path.join(path, f"{name}.bin"), dtype=np.dtype(spec['dtype']))
+        columns[name] = values.reshape(-1, *spec['shape'])
+    rows = min(len(values) for values in columns.values())
+    return meta, {name: values[:rows] for name, values in columns.items()}
+
+
+def list_sessions(root):
+    if not os.path.isdir(root):
+        return []
+    names = [name for name in os.listdir(root) if os.path.isfile(os.path.join(root, name, META_FILE))]
+    return sorted(names, reverse=True)
+
+
+class SessionPlayer:
+    # Plays a recording back as MotionService-style results, paced by the
+    # recorded timestamps divided by `speed`. When the consumer falls behind
+    # (high speeds), late rows are skipped rather than replayed in a burst.
+    def __init__(self, path, speed=1.0, skip_late=True):
+        self.meta, self.columns = load_session(path)
+        self.speed = speed
+        self.skip_late = skip_late
+        self.capture = cv2.VideoCapture(os.path.join(path, VIDEO_FILE))
+        self.position = 0
+        self.skipped = 0
+        self._video_position = 0
+        self._frame = None
+        self._start = None
+
+    def __len__(self):
+        return len(self.columns['seq'])
+
+    def __iter__(self):
+        return self
+
+    def _due(self, i):
+        timestamps = self.columns['timestamp']
+        return self._start + (timestamps[i] - timestamps[0]) / self.speed
+
+    def _read_frame(self, i):
+        # Frames are decoded in order; skipped ones are only grabbed.
+        while self._video_position < i:
+            self.capture.grab()
+            self._video_position += 1
+        ok, frame = self.capture.read()
+        self._video_position += 1
+        if ok:
+            self._frame = frame
+        return self._frame
+
+    def __next__(self):
+        if self.position >= len(self):
+            raise StopIteration
+        if self._start is None:
+            self._start = time.perf_counter()
+
+        i = self.position
+        now = time.perf_counter()
+        if self.skip_late:
+            while i + 1 < len(self) and self._due(i + 1) <= now:
+                i += 1
+            self.skipped += i - self.position
+        delay = self._due(i) - now
+        if delay > 0:
+            time.sleep(delay)
+        self.position = i + 1
+        return self._result(i)
+
+    def _result(self, i):
+        c = self.columns
+        body_regions = self.meta['body_regions']
+        brain = {}
+        for k, region in enumerate(BRAIN_REGIONS):
+            code = int(c['body_part'][i, k])
+            brain[region] = {
+                'active': bool(c['brain_active'][i, k]),
+                'body_part': body_regions[code] if code >= 0 else None,
+                'score': float(c['brain_score'][i, k]),
+            }
+        return {
+            'seq': int(c['seq'][i]),
+            'timestamp': float(c['timestamp'][i]),
+            'frame': self._read_frame(i),
+            'active_brain_regions': brain,
+            'active_regions': dict(zip(body_regions, c['body_active'][i].tolist())),
+            'region_scores': dict(zip(body_regions, c['body_score'][i].tolist())),
+            'cooldown': dict(zip(body_regions, c['cooldown'][i].tolist())),
+            'detection_info': {'engine': self.meta['engine'], 'contours': int(c['contours'][i])},
+            'traces': c['traces'][i],
+        }
+
+    def close(self):
+        self.capture.release()
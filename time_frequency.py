@@ -0,0 +1,120 @@
+import numpy as np
+from scipy import signal
+
+# Trial timeline in BCI IV 2a: fixation cross at 0 s, cue at 2 s, motor
+# imagery from 3 s to 6 s. The reference interval sits before the cue.
+BASELINE = (0.5, 1.5)
+
+
+def _class_sums(power, labels, classes, sums):
+    for k, code in enumerate(classes):
+        members = labels == code
+        if members.any():
+            sums[k] += power[members].sum(axis=0)
+
+
+def stft_power(epochs, labels, classes, fs, fmin=4, fmax=40, nperseg=None, hop=None, chunk=64):
+    # Hann-windowed short-time power of every trial and channel, summed per
+    # class. All frames of a block of trials are cut with one strided view
+    # and transformed in a single rfft call.
+    nperseg = nperseg or int(fs)
+    hop = hop or max(1, int(fs) // 10)
+    freqs = np.fft.rfftfreq(nperseg, 1 / fs)
+    band = (freqs >= fmin) & (freqs <= fmax)
+    window = signal.get_window('hann', nperseg).astype(np.float32)
+    scale = 1.0 / (fs * (window ** 2).sum())
+
+    n_frames = (epochs.shape[-1] - nperseg) // hop + 1
+    times = (np.arange(n_frames) * hop + nperseg / 2) / fs
+    sums = np.zeros((len(classes), epochs.shape[1], band.sum(), n_frames), dtype=np.float64)
+
+    for start in range(0, len(epochs), chunk):
+        block = np.nan_to_num(epochs[start:start + chunk]).astype(np.float32, copy=False)
+        frames = np.lib.stride_tricks.sliding_window_view(block, nperseg, axis=-1)[..., ::hop, :]
+        spectrum = np.fft.rfft(frames * window, axis=-1)[..., band]
+        # (trials, channels, frames, freqs) -> (trials, channels, freqs, frames)
+        power = (spectrum.real ** 2 + spectrum.imag ** 2).swapaxes(-1, -2) * scale
+        _class_sums(power, labels[start:start + chunk], classes, sums)
+
+    return freqs[band], times, sums
+
+
+def morlet_power(epochs, labels, classes, fs, freqs=None, n_cycles=7.0, decim=None, chunk=16):
+    # Complex Morlet wavelet power via FFT convolution. The wavelets are built
+    # directly in the frequency domain (a Gaussian around each centre
+    # frequency, zero for negative frequencies), so each block of trials needs
+    # one forward FFT and one batched inverse FFT for all frequencies.
+    freqs = np.arange(4, 41, 1.0) if freqs is None else np.asarray(freqs, dtype=np.float64)
+    decim = decim or max(1, int(fs) // 10)
+    n_samples = epochs.shape[-1]
+    nfft = 1 << int(np.ceil(np.log2(2 * n_samples)))
+
+    fft_freqs = np.fft.fftfreq(nfft, 1 / fs)
+    sigma_f = freqs / n_cycles
+    wavelets = np.exp(-0.5 * ((fft_freqs[None, :] - freqs[:, None]) / sigma_f[:, None]) ** 2)
+    wavelets[:, fft_freqs < 0] = 0
+    # Unit gain at the centre frequency; amplitude of a sinusoid is preserved.
+    wavelets = (2 * wavelets).astype(np.complex64)
+
+    keep = np.arange(0, n_samples, decim)
+    times = keep / fs
+    sums = np.zeros((len(classes), epochs.shape[1], len(freqs), len(keep)), dtype=np.float64)
+
+    for start in range(0, len(epochs), chunk):
+        block = np.nan_to_num(epochs[start:start + chunk]).astype(np.float32, copy=False)
+        spectrum = np.fft.fft(block, nfft, axis=-1).astype(np.complex64)
+        analytic = np.fft.ifft(spectrum[:, :, None, :] * wavelets, axis=-1)[..., keep]
+        power = analytic.real ** 2 + analytic.imag ** 2
+        _class_sums(power, labels[start:start + chunk], classes, sums)
+
+    return freqs, times, sums
+
+
+def baseline_normalize(power, times, baseline=BASELINE, mode='percent'):
+    # ERD/ERS relative to the mean power in the reference interval: negative
+    # values are desynchronisation, positive values synchronisation.
+    ref = (times >= baseline[0]) & (times <= baseline[1])
+    if not ref.any():
+        raise ValueError(f"Baseline {baseline} is outside the epoch ({times[0]:.2f}-{times[-1]:.2f} s)")
+    reference = power[..., ref].mean(axis=-1, keepdims=True)
+    reference[reference == 0] = np.finfo(power.dtype).tiny
+    if mode == 'percent':
+        return (power / reference - 1) * 100
+    if mode == 'db':
+        return 10 * np.log10(np.maximum(power, np.finfo(power.dtype).tiny) / reference)
+    raise ValueError(f"Unknown baseline mode: {mode}")
+
+
+def compute_erd(dataset, channels=(7, 9, 11), method='stft', baseline=BASELINE, mode='percent',
+                fmin=4, fmax=40, clean=True, eog=False):
+    epochs, labels = dataset.get_epochs(list(channels), dtype=np.float32, clean=clean, eog=eog)
+    classes = np.array([code for code in np.unique(labels) if code in dataset.mi_types])
+
+    if method == 'stft':
+        freqs, times, sums = stft_power(epochs, labels, classes, dataset.Fs, fmin, fmax)
+    elif method == 'morlet':
+        freqs, times, sums = morlet_power(epochs, labels, classes, dataset.Fs,
+                                          freqs=np.arange(fmin, fmax + 1, 1.0))
+    else:
+        raise ValueError(f"Unknown time-frequency method: {method}")
+
+    counts = np.array([(labels == code).sum() for code in classes])
+    power = sums / counts[:, None, None, None]
+    return {
+        'erd': baseline_normalize(power, times, baseline, mode).astype(np.float32),
+        'power': power.astype(np.float32),
+        'freqs': freqs,
+        'times': times,
+        'classes': classes,
+        'counts': counts,
+        'channels': np.asarray(channels),
+    }
+
+
+def get_erd(dataset, channels=(7, 9, 11), method='stft', baseline=BASELINE, mode='percent', fmin=4, fmax=40,
+            clean=True, eog=False):
+    key = ('erd', tuple(channels), method, tuple(baseline), mode, fmin, fmax, clean, eog)
+    return dataset.cache.get(
+        dataset.path, key,
+        lambda: compute_erd(dataset, channels, method, baseline, mode, fmin, fmax, clean, eog)
+    )